@@ -0,0 +1,267 @@
+"""
+Benchmark suite for silero_api_server.
+
+    python -m benchmarks.run                         # everything, with the stub model
+    python -m benchmarks.run --suite micro
+    python -m benchmarks.run --real-model ~/v5_ru.pt --output real.json
+    python -m benchmarks.run --compare baseline.json --output current.json
+
+Results are written as JSON. --compare prints the change of every metric against an
+earlier run and exits non-zero when one regressed by more than --threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SHORT_TEXTS = [
+    "Доброе утро.",
+    "Температура на улице минус 5 градусов.",
+    "Влажность 80 процентов.",
+    "Входная дверь открыта.",
+]
+
+LONG_TEXT = (
+    "Сегодня в городе облачно, временами небольшой дождь. Днём температура поднимется до 12 градусов, "
+    "к вечеру опустится до 7 градусов. Ветер северо-западный, 5 метров в секунду, порывы до 12 метров в секунду. "
+    "Атмосферное давление 745 миллиметров ртутного столба, влажность 82 процента. "
+    "Завтра ожидается переменная облачность без существенных осадков, температура от 9 до 15 градусов. "
+    "В выходные погода улучшится: солнечно, до 18 градусов тепла, ветер слабый. "
+) * 3
+
+def percentiles(values: list[float]) -> dict:
+    values = sorted(values)
+    def pick(q):
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "mean": statistics.fmean(values)}
+
+def wav_seconds(data: bytes) -> float:
+    "Duration of a 16-bit mono WAV, also for streamed WAVs with unknown length in the header"
+    rate = int.from_bytes(data[24:28], "little")
+    return max(0, len(data) - 44) / 2 / rate
+
+def load_run(requests: int, concurrency: int, call) -> dict:
+    "Run call(i) -> (latency, first_byte, audio_seconds) requests times with the given concurrency"
+    results = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for result in pool.map(call, range(requests)):
+            results.append(result)
+    wall = time.perf_counter() - started
+    latencies = [r[0] for r in results]
+    audio = sum(r[2] for r in results)
+    summary = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "latency_s": percentiles(latencies),
+        "throughput_rps": requests / wall,
+        "audio_s_per_s": audio / wall,
+        "rtf": sum(latencies) / audio if audio else None,
+    }
+    first_bytes = [r[1] for r in results if r[1] is not None]
+    if first_bytes:
+        summary["first_audio_s"] = percentiles(first_bytes)
+    return summary
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_http(app) -> tuple:
+    import uvicorn
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+def bench_http(service, app, args) -> dict:
+    import requests
+    server, base = start_http(app)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(args.concurrency))
+    session.mount("http://", adapter)
+    while session.get(f"{base}/health/ready").status_code != 200:
+        time.sleep(0.05)
+
+    def endpoint(path, body, stream=False):
+        def call(i):
+            payload = dict(body(i))
+            started = time.perf_counter()
+            first = None
+            with session.post(f"{base}{path}", json=payload, stream=stream) as response:
+                response.raise_for_status()
+                data = b""
+                for chunk in response.iter_content(chunk_size=None):
+                    if first is None:
+                        first = time.perf_counter() - started
+                    data += chunk
+            return time.perf_counter() - started, first if stream else None, wav_seconds(data)
+        return call
+
+    # A counter in every text keeps responses out of the synthesis cache
+    cases = {
+        "tts_generate_short": endpoint("/tts/generate", lambda i: {"speaker": "baya", "text": f"{SHORT_TEXTS[i % len(SHORT_TEXTS)]} Номер {i}."}),
+        "openai_speech_short": endpoint("/v1/audio/speech", lambda i: {"voice": "baya", "input": f"{SHORT_TEXTS[i % len(SHORT_TEXTS)]} Номер {i}.", "response_format": "wav"}),
+        "openai_speech_long": endpoint("/v1/audio/speech", lambda i: {"voice": "baya", "input": f"{LONG_TEXT} Номер {i}.", "response_format": "wav"}),
+        "openai_speech_long_stream": endpoint("/v1/audio/speech", lambda i: {"voice": "baya", "input": f"{LONG_TEXT} Номер {i}.", "response_format": "wav", "stream": True}, stream=True),
+    }
+    results = {}
+    for name, call in cases.items():
+        for concurrency in args.concurrency:
+            requests_count = max(args.requests, concurrency * 2)
+            if "long" in name:
+                requests_count = max(2, requests_count // 4)
+            results[f"{name}@{concurrency}"] = load_run(requests_count, concurrency, call)
+    server.should_exit = True
+    return results
+
+def bench_wyoming(service, args) -> dict:
+    from wyoming.audio import AudioChunk, AudioStop
+    from wyoming.client import AsyncTcpClient
+    from wyoming.tts import Synthesize, SynthesizeVoice
+    from silero_api_server.wyoming_server import SileroWyomingServer
+
+    port = free_port()
+    loop = asyncio.new_event_loop()
+    server = SileroWyomingServer("127.0.0.1", port, service)
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(server.start(server.create_handler), loop).result()
+
+    async def synthesize(text):
+        started = time.perf_counter()
+        first = None
+        audio = 0.0
+        async with AsyncTcpClient("127.0.0.1", port) as client:
+            await client.write_event(Synthesize(text=text, voice=SynthesizeVoice(name="baya")).event())
+            while event := await client.read_event():
+                if AudioChunk.is_type(event.type):
+                    chunk = AudioChunk.from_event(event)
+                    if first is None:
+                        first = time.perf_counter() - started
+                    audio += len(chunk.audio) / chunk.width / chunk.rate
+                elif AudioStop.is_type(event.type):
+                    break
+        return time.perf_counter() - started, first, audio
+
+    def call(i):
+        return asyncio.run(synthesize(f"{SHORT_TEXTS[i % len(SHORT_TEXTS)]} Номер {i}."))
+
+    results = {}
+    for concurrency in args.concurrency:
+        results[f"wyoming_short@{concurrency}"] = load_run(max(args.requests, concurrency * 2), concurrency, call)
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    return results
+
+def timeit(func, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return percentiles(timings)
+
+def bench_micro(service, args) -> dict:
+    import numpy as np
+    from silero_api_server.audio import assemble, encode
+    from silero_api_server.morph_utils import apply_morphology
+    from silero_api_server.text_utils import chunk_text
+
+    repeat = args.repeat
+    numbers_text = " ".join(f"{i * 37 % 1000} градусов, {i * 13 % 100}% и {i}.{i % 10} процента" for i in range(40))
+    apply_morphology("прогрев", "ru") # Load the dictionaries outside the timings
+    pieces = [np.random.default_rng(i).uniform(-0.5, 0.5, 48000 * 3).astype(np.float32) for i in range(20)]
+    return {
+        "apply_morphology_short": timeit(lambda: apply_morphology(SHORT_TEXTS[1], "ru"), repeat),
+        "apply_morphology_numbers": timeit(lambda: apply_morphology(numbers_text, "ru"), repeat),
+        "split_text_long": timeit(lambda: service.split_text(LONG_TEXT * 4), repeat),
+        "chunk_text_long": timeit(lambda: chunk_text(LONG_TEXT * 4, service.max_char_length), repeat),
+        "assemble_60s": timeit(lambda: assemble(pieces, [150] * len(pieces), 48000), repeat),
+        "encode_wav_60s": timeit(lambda: encode(np.concatenate(pieces), 48000, "wav"), repeat),
+    }
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    "Print the relative change of every shared metric, returning the regressions"
+    regressions = []
+    def walk(cur, base, path):
+        for key, value in cur.items():
+            if key not in base:
+                continue
+            name = f"{path}.{key}" if path else key
+            if isinstance(value, dict):
+                walk(value, base[key], name)
+            elif isinstance(value, (int, float)) and isinstance(base[key], (int, float)) and base[key]:
+                change = (value - base[key]) / base[key]
+                # Throughput style metrics regress when they go down, everything else when it goes up
+                worse = -change if any(k in key for k in ("throughput", "per_s")) else change
+                flag = "REGRESSION" if worse > threshold else ""
+                print(f"{name:70s} {base[key]:12.5f} -> {value:12.5f} {change:+8.1%} {flag}")
+                if flag:
+                    regressions.append(name)
+    walk(current["results"], baseline["results"], "")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmarks.run", description="Benchmark silero_api_server")
+    parser.add_argument("--suite", choices=["all", "micro", "http", "wyoming"], default="all")
+    parser.add_argument("--real-model", help="Path to a downloaded .pt model, default is the stub model")
+    parser.add_argument("--model-id", default="v5_ru.pt")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="Requests per load run")
+    parser.add_argument("--repeat", type=int, default=50, help="Repetitions per microbenchmark")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change counted as a regression")
+    args = parser.parse_args()
+    # Importing the server changes the working directory, paths given on the command line stay relative to the caller's
+    for name in ("real_model", "output", "compare"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    from benchmarks import stub_model
+    from silero_api_server.server import app, tts_service
+    stub_model.install(tts_service, args.model_id, args.real_model)
+
+    results = {}
+    if args.suite in ("all", "micro"):
+        results["micro"] = bench_micro(tts_service, args)
+    if args.suite in ("all", "http"):
+        results["http"] = bench_http(tts_service, app, args)
+    if args.suite in ("all", "wyoming"):
+        results["wyoming"] = bench_wyoming(tts_service, args)
+
+    report = {
+        "meta": {
+            "model": args.real_model or "stub",
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare(report, json.load(fh), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Deterministic stand-in for a Silero model, so benchmarks run without network or GPU.
+"""
+import time
+import wave
+import zlib
+from pathlib import Path
+import torch
+
+STUB_SPEAKERS = ["aidar", "baya", "kseniya", "xenia", "eugene", "random"]
+
+class StubModel:
+    """
+    Matches the apply_tts/save_wav/speakers interface of a Silero package model.
+    Audio length and content depend only on the text, speaker and rate, and
+    inference cost is a fixed time per character plus a fixed overhead per call.
+    """
+    def __init__(self, speakers=STUB_SPEAKERS, seconds_per_char=0.0004, seconds_per_call=0.005, audio_per_char=0.065) -> None:
+        self.speakers = list(speakers)
+        self.seconds_per_char = seconds_per_char
+        self.seconds_per_call = seconds_per_call
+        self.audio_per_char = audio_per_char
+
+    def to(self, device):
+        return self
+
+    def apply_tts(self, text=None, ssml_text=None, speaker="baya", sample_rate=48000, put_accent=True, put_yo=True):
+        text = text or ssml_text or ""
+        if speaker not in self.speakers:
+            raise ValueError(f"Speaker {speaker} not in {self.speakers}")
+        time.sleep(self.seconds_per_call + self.seconds_per_char * len(text))
+        samples = max(1, int(len(text) * self.audio_per_char * sample_rate))
+        frequency = 120 + zlib.crc32(f"{speaker}|{text}".encode("utf-8")) % 240
+        t = torch.arange(samples, dtype=torch.float32) / sample_rate
+        return 0.3 * torch.sin(2 * torch.pi * frequency * t)
+
+    def save_wav(self, text=None, ssml_text=None, speaker="baya", sample_rate=48000, audio_path="test.wav", **kwargs):
+        audio = self.apply_tts(text, ssml_text, speaker, sample_rate)
+        with wave.open(str(audio_path), "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes((audio.clamp(-1, 1) * 32767).to(torch.int16).numpy().tobytes())
+        return audio_path
+
+def install(service, model_id="v5_ru.pt", model_file=None, model=None):
+    """
+    Point a SileroTtsService at the stub (or at an already downloaded model file) without
+    touching the network, and start it
+    """
+    lang = Path(model_id).stem.split("_")[-1]
+    service.langs = {model_id: f"https://models.silero.ai/models/tts/{lang}/{model_id}"}
+    service.list_languages = lambda *args, **kwargs: service.langs
+    if model_file:
+        model_file = Path(model_file).resolve()
+        service.model_path = lambda _: model_file
+    else:
+        model = model or StubModel()
+        service.registry.loader = lambda _: model
+        service.registry.sizer = lambda _: 0
+        service.download_model = lambda _: Path(model_id)
+    # Measure synthesis, not cache hits of whole responses or of single sentences
+    service.init_cache("", 0, 0)
+    service.init_segment_cache(0)
+    service.start(model_id)
+    return service
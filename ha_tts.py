@@ -81,7 +81,8 @@ class SileroTTSProvider(Provider):
         payload = {
             "input": message,
             "voice": voice,
-            "model": "tts-1"
+            "model": "tts-1",
+            "response_format": "wav"
         }
 
         try:
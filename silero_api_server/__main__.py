@@ -2,8 +2,10 @@ import uvicorn
 import asyncio
 from silero_api_server.server import app, tts_service
 from silero_api_server.wyoming_server import run_wyoming_server
+from silero_api_server import morph_utils
 
 import argparse
+from pathlib import Path
 
 parser = argparse.ArgumentParser(
                     prog='silero_api_server',
@@ -12,17 +14,58 @@ parser.add_argument('-o','--host', action='store', dest='host', default='0.0.0.0
 parser.add_argument('-p','--port', action='store', dest='port', type=int, default=8001)
 parser.add_argument('-s','--session_path', action='store', dest='session_path', type=str, default="sessions")
 parser.add_argument('-m','--model', action='store', dest='model', type=str, default="v5_ru.pt")
+parser.add_argument('--session-mode', action='store', dest='session_mode', choices=['files', 'append'], default='files', help='One file per utterance, or one growing file plus an index per session')
+parser.add_argument('--cache-dir', action='store', dest='cache_dir', type=str, default="cache", help='Directory for the on-disk synthesis cache, empty to disable')
+parser.add_argument('--cache-memory-mb', action='store', dest='cache_memory_mb', type=float, default=64)
+parser.add_argument('--cache-disk-mb', action='store', dest='cache_disk_mb', type=float, default=512)
+parser.add_argument('--segment-cache-mb', action='store', dest='segment_cache_mb', type=float, default=32, help='Memory for audio of single sentences reused across texts, 0 synthesizes short texts whole')
+parser.add_argument('--sentence-pause-ms', action='store', dest='sentence_pause_ms', type=int, default=tts_service.sentence_pause_ms, help='Silence between separately synthesized sentences')
+parser.add_argument('--clause-pause-ms', action='store', dest='clause_pause_ms', type=int, default=tts_service.clause_pause_ms, help='Silence between the clauses a long sentence is split into')
+parser.add_argument('--batch-size', action='store', dest='batch_size', type=int, default=8, help='Maximum sentences per inference batch')
+parser.add_argument('--batch-wait-ms', action='store', dest='batch_wait_ms', type=float, default=5, help='How long to wait for more sentences before running a batch')
+parser.add_argument('--workers', action='store', dest='workers', type=int, default=1, help='Number of inference workers')
+parser.add_argument('--worker-mode', action='store', dest='worker_mode', choices=['thread', 'process'], default='thread')
+parser.add_argument('--threads-per-worker', action='store', dest='threads_per_worker', type=int, default=4, help='Intra-op torch threads for each worker')
+parser.add_argument('--max-queue', action='store', dest='max_queue', type=int, default=256, help='Queued sentences before requests are rejected with 503')
+parser.add_argument('--preload-morphology', action='store', dest='preload_morphology', type=str, default="", help='Comma separated languages (ru,uk) whose morphology dictionaries load at startup')
+parser.add_argument('--model-memory-mb', action='store', dest='model_memory_mb', type=float, default=2048, help='Memory budget for resident models')
+parser.add_argument('--max-models', action='store', dest='max_models', type=int, default=4, help='Maximum number of resident models')
+parser.add_argument('--model-dir', action='store', dest='model_dir', type=str, default=str(tts_service.model_dir), help='Model store shared between installs, defaults to $SILERO_MODEL_DIR or ~/.cache/silero-api-server/models')
+parser.add_argument('--download-connections', action='store', dest='download_connections', type=int, default=4, help='Parallel range requests per model download')
+parser.add_argument('--admin-token', action='store', dest='admin_token', type=str, default=app.state.admin_token, help='Token allowing requests to be profiled (X-Admin-Token header), defaults to $SILERO_ADMIN_TOKEN')
+parser.add_argument('--profile-dir', action='store', dest='profile_dir', type=str, default="profiles", help='Directory for saved request profiles, empty to only return Server-Timing headers')
+parser.add_argument('--offline', action='store_true', dest='offline', help='Never fetch the model index, use the stored one')
+parser.add_argument('--index-url', action='store', dest='index_url', type=str, default=tts_service.model_index.base_url, help='Directory listing the models are crawled from')
+parser.add_argument('--index-ttl-hours', action='store', dest='index_ttl_hours', type=float, default=24, help='Age after which the stored model index is refreshed in the background')
 parser.add_argument('--show-models', action='store_true', dest='show_models')
 parser.add_argument('--wyoming-port', type=int, dest='wyoming_port', help='Start Wyoming protocol server on this port')
+parser.add_argument('--wyoming-sample-rate', type=int, dest='wyoming_sample_rate', default=22050, help='Output rate of Wyoming audio, 8000/24000/48000 need no resampling')
 
 args = parser.parse_args()
 
 if help not in args:
+    tts_service.model_dir = Path(args.model_dir).expanduser()
+    tts_service.download_connections = args.download_connections
+    tts_service.model_index.offline = args.offline
+    tts_service.model_index.base_url = args.index_url.rstrip("/")
+    tts_service.model_index.ttl = args.index_ttl_hours * 3600
     if args.show_models:
-        for lang in tts_service.langs.keys():
+        for lang in tts_service.list_languages().keys():
             print(lang)
     else:
-        tts_service.load_model(args.model)
+        tts_service.init_cache(args.cache_dir, args.cache_memory_mb, args.cache_disk_mb)
+        tts_service.init_segment_cache(args.segment_cache_mb)
+        tts_service.session_writer.mode = args.session_mode
+        tts_service.sentence_pause_ms = args.sentence_pause_ms
+        tts_service.clause_pause_ms = args.clause_pause_ms
+        tts_service.scheduler.max_batch_size = args.batch_size
+        tts_service.scheduler.max_wait_ms = args.batch_wait_ms
+        app.state.model_id = args.model
+        app.state.admin_token = args.admin_token
+        app.state.profile_dir = args.profile_dir
+        tts_service.init_registry(args.model_memory_mb, args.max_models)
+        morph_utils.preload([lang for lang in args.preload_morphology.split(",") if lang])
+        tts_service.init_workers(args.workers, args.worker_mode, args.threads_per_worker, args.max_queue)
         
         async def main():
             tasks = []
@@ -34,7 +77,7 @@ if help not in args:
             
             # Wyoming task
             if args.wyoming_port:
-                tasks.append(run_wyoming_server(args.host, args.wyoming_port, tts_service))
+                tasks.append(run_wyoming_server(args.host, args.wyoming_port, tts_service, args.wyoming_sample_rate))
             
             await asyncio.gather(*tasks)
 
@@ -0,0 +1,223 @@
+import io
+import struct
+from functools import lru_cache
+import wave
+import numpy as np
+import soundfile as sf
+import torch
+import torchaudio
+
+SAMPLE_WIDTH = 2 # 16-bit PCM
+CHANNELS = 1
+
+# response_format -> media type
+MEDIA_TYPES = {
+    "pcm": "audio/pcm",
+    "wav": "audio/wav",
+    "flac": "audio/flac",
+    "opus": "audio/opus",
+    "mp3": "audio/mpeg",
+}
+
+# Rates the Silero models generate directly
+NATIVE_RATES = (8000, 24000, 48000)
+
+# Rates the Opus encoder accepts
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+# Rates libsndfile's MPEG encoder accepts
+MP3_RATES = (8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000)
+
+# Formats whose header is only correct once the length is known (FLAC STREAMINFO
+# sample count and MD5, the MP3 Xing/Info frame), streamed as a whole at the end
+BUFFERED_STREAM_FORMATS = ("flac", "mp3")
+
+# Formats encoded by libsndfile: response_format -> (format, subtype)
+SOUNDFILE_FORMATS = {
+    "flac": ("FLAC", "PCM_16"),
+    "opus": ("OGG", "OPUS"),
+    "mp3": ("MP3", "MPEG_LAYER_III"),
+}
+
+def to_numpy(audio) -> np.ndarray:
+    "Flat float32 array from a tensor or array"
+    if isinstance(audio, torch.Tensor):
+        audio = audio.detach().to("cpu").numpy()
+    return np.asarray(audio, dtype=np.float32).reshape(-1)
+
+def to_pcm16(audio) -> bytes:
+    "Convert float audio in [-1, 1] to little-endian 16-bit PCM bytes"
+    audio = np.clip(to_numpy(audio), -1.0, 1.0)
+    return (audio * 32767).astype("<i2").tobytes()
+
+def assemble(pieces: list, pauses_ms: list[int], sample_rate: int) -> np.ndarray:
+    "Join audio pieces in order into one preallocated buffer, with pauses_ms[i] of silence before piece i"
+    pieces = [to_numpy(piece) for piece in pieces]
+    gaps = [int(sample_rate * ms / 1000) for ms in pauses_ms]
+    out = np.zeros(sum(len(p) for p in pieces) + sum(gaps), dtype=np.float32)
+    pos = 0
+    for piece, gap in zip(pieces, gaps):
+        pos += gap
+        out[pos:pos + len(piece)] = piece
+        pos += len(piece)
+    return out
+
+def closest_rate(sample_rate: int, rates=NATIVE_RATES) -> int:
+    "Smallest rate that is at least sample_rate, so we only ever downsample, else the highest"
+    for rate in sorted(rates):
+        if rate >= sample_rate:
+            return rate
+    return max(rates)
+
+def encoder_rate(response_format: str, sample_rate: int) -> int:
+    "Sample rate the encoder for response_format can actually write"
+    if response_format == "opus" and sample_rate not in OPUS_RATES:
+        return closest_rate(sample_rate, OPUS_RATES)
+    if response_format == "mp3" and sample_rate not in MP3_RATES:
+        return closest_rate(sample_rate, MP3_RATES)
+    return sample_rate
+
+@lru_cache(maxsize=32)
+def _resampler(orig_rate: int, new_rate: int) -> torchaudio.transforms.Resample:
+    "Resampling kernels are computed once per rate pair"
+    return torchaudio.transforms.Resample(orig_rate, new_rate)
+
+def resample(audio, orig_rate: int, new_rate: int) -> torch.Tensor:
+    "Resample mono float audio"
+    if orig_rate == new_rate:
+        return audio
+    if not isinstance(audio, torch.Tensor):
+        audio = torch.from_numpy(to_numpy(audio))
+    with torch.no_grad():
+        return _resampler(orig_rate, new_rate)(audio)
+
+def silence(duration_ms: int, sample_rate: int) -> torch.Tensor:
+    "Float tensor of silence of the given duration"
+    return torch.zeros(int(sample_rate * duration_ms / 1000))
+
+def to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    "Wrap 16-bit mono PCM in a WAV container, entirely in memory"
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(CHANNELS)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+def wav_stream_header(sample_rate: int) -> bytes:
+    "WAV header for a stream of unknown length, sizes set to the maximum as most players expect"
+    byte_rate = sample_rate * CHANNELS * SAMPLE_WIDTH
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, CHANNELS, sample_rate, byte_rate, CHANNELS * SAMPLE_WIDTH, SAMPLE_WIDTH * 8)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+def check_format(response_format: str):
+    if response_format not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported response_format {response_format}, expected one of {list(MEDIA_TYPES)}")
+
+def encode(audio, sample_rate: int, response_format="wav") -> bytes:
+    "Encode float audio into response_format, entirely in memory"
+    check_format(response_format)
+    if response_format == "pcm":
+        return to_pcm16(audio)
+    if response_format == "wav":
+        return to_wav(to_pcm16(audio), sample_rate)
+    buffer = io.BytesIO()
+    file_format, subtype = SOUNDFILE_FORMATS[response_format]
+    sf.write(buffer, to_numpy(audio), sample_rate, format=file_format, subtype=subtype)
+    return buffer.getvalue()
+
+class _StreamSink(io.RawIOBase):
+    """
+    Write-only file for libsndfile that hands out bytes as soon as they are written.
+    Encoders may seek back to patch headers once the stream ends, writes into
+    bytes that were already sent are dropped.
+    """
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.offset = 0 # Absolute position of buffer[0]
+        self.pos = 0
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        end = self.offset + len(self.buffer)
+        self.pos = {io.SEEK_SET: pos, io.SEEK_CUR: self.pos + pos, io.SEEK_END: end + pos}[whence]
+        return self.pos
+
+    def read(self, size=-1):
+        return b""
+
+    def write(self, data):
+        data = bytes(data)
+        written = len(data)
+        if self.pos < self.offset:
+            data = data[self.offset - self.pos:]
+            self.pos = self.offset
+        start = self.pos - self.offset
+        if start > len(self.buffer):
+            self.buffer.extend(bytes(start - len(self.buffer)))
+        self.buffer[start:start + len(data)] = data
+        self.pos += len(data)
+        return written
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.offset += len(self.buffer)
+        self.buffer.clear()
+        return data
+
+class StreamEncoder:
+    """
+    Incrementally encode audio pieces, returning the bytes ready to send after each one.
+    FLAC and MP3 are collected and encoded in one piece by close().
+    """
+    def __init__(self, response_format: str, sample_rate: int) -> None:
+        check_format(response_format)
+        self.response_format = response_format
+        self.sample_rate = sample_rate
+        self.started = False
+        self.sink = None
+        self.pieces = []
+        if response_format in BUFFERED_STREAM_FORMATS:
+            return
+        if response_format in SOUNDFILE_FORMATS:
+            file_format, subtype = SOUNDFILE_FORMATS[response_format]
+            self.sink = _StreamSink()
+            self.file = sf.SoundFile(self.sink, mode="w", samplerate=sample_rate, channels=CHANNELS,
+                                     format=file_format, subtype=subtype)
+
+    def write(self, audio) -> bytes:
+        if self.response_format in BUFFERED_STREAM_FORMATS:
+            self.pieces.append(to_numpy(audio))
+            return b""
+        if self.sink:
+            self.file.write(to_numpy(audio))
+            return self.sink.drain()
+        data = to_pcm16(audio)
+        if self.response_format == "wav" and not self.started:
+            data = wav_stream_header(self.sample_rate) + data
+        self.started = True
+        return data
+
+    def close(self) -> bytes:
+        if self.response_format in BUFFERED_STREAM_FORMATS:
+            audio = np.concatenate(self.pieces) if self.pieces else np.zeros(0, dtype=np.float32)
+            return encode(audio, self.sample_rate, self.response_format)
+        if self.sink:
+            self.file.close()
+            return self.sink.drain()
+        if self.response_format == "wav" and not self.started:
+            return wav_stream_header(self.sample_rate)
+        return b""
@@ -0,0 +1,134 @@
+import os
+import threading
+from collections import OrderedDict
+from hashlib import md5
+from pathlib import Path
+from typing import Optional
+from loguru import logger
+from silero_api_server.metrics import CACHE_LOOKUPS
+
+class SynthesisCache:
+    """
+    Content addressed cache of synthesized audio with a bounded in-memory
+    LRU tier in front of a size capped on-disk tier
+    """
+    def __init__(self, path="cache", memory_items=256, memory_bytes=64 << 20, disk_bytes=512 << 20, name="audio") -> None:
+        self.name = name # Label of this cache's metrics
+        self.memory_items = memory_items
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self.init_path(path)
+
+    def init_path(self, path):
+        self.path = Path(path) if path else None
+        self._disk_size = 0
+        if not self.path:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._disk_size = sum(f.stat().st_size for f in self.path.glob("*.bin"))
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        "Hash the parts that fully determine the audio"
+        return md5("\0".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    def file_for(self, key: str) -> Optional[Path]:
+        "Location of the on-disk copy of key, if the disk tier is enabled"
+        return self.path.joinpath(f"{key}.bin") if self.path else None
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS.labels(self.name, "memory", "hit").inc()
+                return data
+
+        file = self.file_for(key)
+        if file:
+            try:
+                data = file.read_bytes()
+                os.utime(file) # Refresh recency for disk eviction
+            except OSError:
+                data = None
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                CACHE_LOOKUPS.labels(self.name, "all", "miss").inc()
+                return None
+            self.hits += 1
+            CACHE_LOOKUPS.labels(self.name, "disk", "hit").inc()
+            self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self._remember(key, data)
+
+        file = self.file_for(key)
+        if not file or len(data) > self.disk_bytes:
+            return
+        tmp = file.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(data)
+            previous = file.stat().st_size if file.exists() else 0
+            os.replace(tmp, file)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+            tmp.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._disk_size += len(data) - previous
+            over = self._disk_size > self.disk_bytes
+        if over:
+            self._evict_disk()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+        if self.path:
+            for file in self.path.glob("*.bin"):
+                file.unlink(missing_ok=True)
+            self._disk_size = 0
+
+    def _remember(self, key: str, data: bytes):
+        "Insert into the memory tier. Caller holds the lock."
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while len(self._memory) > self.memory_items or self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _evict_disk(self):
+        "Remove least recently used files until the disk tier fits its budget"
+        files = []
+        for file in self.path.glob("*.bin"):
+            try:
+                stat = file.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.disk_bytes * 0.9 # Leave headroom so we don't evict on every put
+        for _, size, file in files:
+            if total <= target:
+                break
+            file.unlink(missing_ok=True)
+            total -= size
+        with self._lock:
+            self._disk_size = total
+        logger.debug(f"Cache disk tier trimmed to {total} bytes")
@@ -0,0 +1,57 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from silero_api_server import profiling
+
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = Histogram("silero_stage_seconds", "Time spent in each pipeline stage", ["stage", "model"], buckets=_BUCKETS)
+REQUEST_SECONDS = Histogram("silero_request_seconds", "Time to produce a whole response", ["model", "protocol"], buckets=_BUCKETS)
+BATCH_SIZE = Histogram("silero_batch_size", "Sentences per inference batch", ["model"], buckets=(1, 2, 4, 8, 16, 32))
+REAL_TIME_FACTOR = Histogram("silero_real_time_factor", "Synthesis time divided by audio duration", ["model", "protocol"],
+                             buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5))
+
+REQUESTS = Counter("silero_requests", "Synthesis requests served", ["model", "speaker", "protocol"])
+CHARACTERS = Counter("silero_characters", "Characters synthesized", ["model", "speaker", "protocol"])
+AUDIO_SECONDS = Counter("silero_audio_seconds", "Seconds of audio produced", ["model", "speaker", "protocol"])
+CACHE_LOOKUPS = Counter("silero_cache_lookups", "Synthesis cache lookups", ["cache", "tier", "result"])
+
+QUEUE_DEPTH = Gauge("silero_queue_depth", "Sentences queued or running on the inference workers")
+RESIDENT_MODELS = Gauge("silero_resident_models", "Models currently loaded")
+MODEL_MEMORY = Gauge("silero_model_memory_bytes", "Approximate memory held by loaded models")
+
+@contextmanager
+def stage(name: str, model: str):
+    "Time the enclosed block as one pipeline stage, also in the request's profile if it is being profiled"
+    started = time.perf_counter()
+    try:
+        with profiling.trace(name):
+            yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(name, model).observe(elapsed)
+        profiling.record(name, elapsed)
+
+def observe_synthesis(protocol: str, model: str, speaker: str, characters: int, audio_seconds: float, elapsed: float):
+    "Record a request that ran the model. Only called after success, so speaker is a real one."
+    REQUESTS.labels(model, speaker, protocol).inc()
+    CHARACTERS.labels(model, speaker, protocol).inc(characters)
+    AUDIO_SECONDS.labels(model, speaker, protocol).inc(audio_seconds)
+    REQUEST_SECONDS.labels(model, protocol).observe(elapsed)
+    if audio_seconds:
+        REAL_TIME_FACTOR.labels(model, protocol).observe(elapsed / audio_seconds)
+
+def observe_cached(protocol: str, model: str, speaker: str, elapsed: float):
+    "Record a request answered from the synthesis cache"
+    REQUESTS.labels(model, speaker, protocol).inc()
+    REQUEST_SECONDS.labels(model, protocol).observe(elapsed)
+
+def track_service(service):
+    "Read queue depth and resident models from the service whenever metrics are scraped"
+    QUEUE_DEPTH.set_function(lambda: service.scheduler.depth())
+    RESIDENT_MODELS.set_function(lambda: len(service.registry.resident()))
+    MODEL_MEMORY.set_function(service.registry.memory_used)
+
+def render() -> tuple[bytes, str]:
+    "Metrics in the Prometheus text format, with their content type"
+    return generate_latest(), CONTENT_TYPE_LATEST
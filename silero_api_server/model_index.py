@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+import requests
+from loguru import logger
+
+DEFAULT_INDEX_URL = "https://models.silero.ai/models/tts"
+MODEL_PREFIXES = ("v3", "v4", "v5")
+
+def _links(html: str) -> list[str]:
+    "Targets of the links in a directory listing"
+    return [link.split('"')[0] for link in html.split('<a href="')][1:]
+
+class ModelIndex:
+    """
+    Map of model file names to download URLs, crawled from the Silero model
+    directory listing. The crawl runs its per-language requests concurrently over
+    one pooled session and is stored on disk with the ETag/Last-Modified of every
+    page, so later crawls only revalidate. An index older than ttl is served as is
+    while a refresh runs in the background. Offline mode never touches the network.
+    """
+    def __init__(self, path="langs.json", base_url=DEFAULT_INDEX_URL, ttl=24 * 3600, offline=False, workers=8, timeout=10) -> None:
+        self.path = Path(path)
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl
+        self.offline = offline
+        self.workers = workers
+        self.timeout = timeout
+        self._refreshing = threading.Lock()
+
+    def load(self) -> dict:
+        "The stored index, converting the flat {model: url} files written by older versions"
+        try:
+            with self.path.open("r") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return {"fetched": 0, "models": {}, "pages": {}}
+        if "models" not in data:
+            return {"fetched": 0, "models": data, "pages": {}}
+        return data
+
+    def expired(self, data: dict) -> bool:
+        return time.time() - data.get("fetched", 0) > self.ttl
+
+    def get(self, block=True, on_update: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Models from the stored index. When it is missing, the crawl blocks if block is set,
+        otherwise (and whenever the index is just old) it runs in the background and
+        on_update receives the new models.
+        """
+        data = self.load()
+        models = data["models"]
+        if self.offline:
+            if not models:
+                logger.warning(f"Offline and no model index at {self.path}")
+            return models
+        if models and not self.expired(data):
+            return models
+        if block and not models:
+            return self.refresh()
+        threading.Thread(target=self._refresh_in_background, args=(on_update,), name="model-index", daemon=True).start()
+        return models
+
+    def refresh(self) -> dict:
+        "Crawl the model directory, revalidating pages already stored, and save the result"
+        with self._refreshing:
+            started = time.perf_counter()
+            old_pages = self.load()["pages"]
+            pages = {}
+            with requests.Session() as session:
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+
+                langs = [link.split("/")[0] for link in self._fetch(session, self.base_url, old_pages, pages)]
+                langs = [lang for lang in langs if lang and not lang.startswith((".", "?"))]
+                with ThreadPoolExecutor(self.workers) as pool:
+                    lang_links = pool.map(lambda lang: self._fetch(session, f"{self.base_url}/{lang}", old_pages, pages), langs)
+                    models = {}
+                    for lang, links in zip(langs, lang_links):
+                        for link in links:
+                            if link.startswith(MODEL_PREFIXES):
+                                models[link] = f"{self.base_url}/{lang}/{link}"
+
+            self._save({"fetched": time.time(), "base_url": self.base_url, "models": models, "pages": pages})
+            logger.info(f"Model index with {len(models)} models refreshed in {time.perf_counter() - started:.2f}s")
+            return models
+
+    def _fetch(self, session: requests.Session, url: str, old_pages: dict, pages: dict) -> list[str]:
+        "Links on a listing page, answered from old_pages when the server says it is unchanged"
+        old = old_pages.get(url, {})
+        headers = {}
+        if old.get("etag"):
+            headers["If-None-Match"] = old["etag"]
+        if old.get("last_modified"):
+            headers["If-Modified-Since"] = old["last_modified"]
+        response = session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and "links" in old:
+            pages[url] = old
+            return old["links"]
+        if not response.ok:
+            raise Exception(f"Failed to get languages from {url}: {response.status_code}")
+        links = _links(response.text)
+        pages[url] = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified"), "links": links}
+        return links
+
+    def _refresh_in_background(self, on_update):
+        if self._refreshing.locked():
+            return
+        try:
+            models = self.refresh()
+        except Exception as e:
+            logger.warning(f"Model index refresh failed, keeping the stored one: {e}")
+            return
+        if on_update:
+            on_update(models)
+
+    def _save(self, data: dict):
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with tmp.open("w") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, self.path)
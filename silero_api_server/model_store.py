@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+import requests
+from loguru import logger
+
+VERIFIED_SUFFIX = ".verified.json"
+DOWNLOAD_BLOCK = 8 << 20
+
+def default_model_dir() -> Path:
+    "Model store shared by every install of the server for this user, unless SILERO_MODEL_DIR says otherwise"
+    if os.environ.get("SILERO_MODEL_DIR"):
+        return Path(os.environ["SILERO_MODEL_DIR"])
+    cache = Path(os.environ.get("XDG_CACHE_HOME") or Path.home().joinpath(".cache"))
+    return cache.joinpath("silero-api-server", "models")
+
+@contextmanager
+def file_lock(path):
+    "Exclusive lock on path across processes, held for the duration of the block"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a+b") as fh:
+        try:
+            import fcntl
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        except ImportError:
+            import msvcrt
+            fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError: # LK_LOCK gives up after 10 seconds
+                    continue
+        yield
+
+def _sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        while block := fh.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+def verify_model(model_file, sha256: Optional[str] = None) -> bool:
+    """
+    Check a model package before it is loaded: every zip member against its CRC,
+    and the whole file against sha256 when given. The result is remembered next to
+    the file, so an unchanged file is only checked once.
+    """
+    model_file = Path(model_file)
+    record = model_file.with_name(f"{model_file.name}{VERIFIED_SUFFIX}")
+    stat = model_file.stat()
+    try:
+        info = json.loads(record.read_text())
+        if info["size"] == stat.st_size and info["mtime"] == stat.st_mtime and (not sha256 or info["sha256"] == sha256):
+            return True
+    except (OSError, ValueError, KeyError):
+        pass
+
+    started = time.perf_counter()
+    try:
+        with zipfile.ZipFile(model_file) as archive:
+            bad = archive.testzip()
+    except zipfile.BadZipFile as e:
+        logger.error(f"{model_file.name} is not a valid model package: {e}")
+        return False
+    if bad:
+        logger.error(f"{model_file.name} is corrupt at {bad}")
+        return False
+    digest = _sha256(model_file)
+    if sha256 and digest != sha256:
+        logger.error(f"{model_file.name} has sha256 {digest}, expected {sha256}")
+        return False
+    record.write_text(json.dumps({"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest}))
+    logger.info(f"Verified {model_file.name} in {time.perf_counter() - started:.2f}s")
+    return True
+
+class _Download:
+    """
+    Download of url into a .part file next to dest, in blocks fetched over parallel
+    range requests. Finished blocks are listed in a .part.json file, so an interrupted
+    download resumes with the blocks still missing as long as the server's ETag and
+    size are unchanged.
+    """
+    def __init__(self, url: str, dest: Path, connections=4, timeout=30) -> None:
+        self.url = url
+        self.dest = dest
+        self.part = dest.with_name(f"{dest.name}.part")
+        self.state_file = dest.with_name(f"{dest.name}.part.json")
+        self.connections = connections
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def run(self) -> Path:
+        with requests.Session() as session:
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.connections)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            head = session.head(self.url, allow_redirects=True, timeout=self.timeout)
+            head.raise_for_status()
+            size = int(head.headers.get("Content-Length", 0))
+            etag = head.headers.get("ETag") or head.headers.get("Last-Modified") or ""
+            if size and head.headers.get("Accept-Ranges", "").lower() == "bytes":
+                self._ranged(session, size, etag)
+            else:
+                self._single(session)
+        os.replace(self.part, self.dest)
+        self.state_file.unlink(missing_ok=True)
+        return self.dest
+
+    def _ranged(self, session, size: int, etag: str):
+        state = {"url": self.url, "size": size, "etag": etag, "done": []}
+        try:
+            old = json.loads(self.state_file.read_text())
+            if self.part.exists() and {k: old.get(k) for k in ("url", "size", "etag")} == {k: state[k] for k in ("url", "size", "etag")}:
+                state["done"] = old["done"]
+        except (OSError, ValueError):
+            pass
+        if not state["done"]:
+            with self.part.open("wb") as fh:
+                fh.truncate(size)
+        blocks = [start for start in range(0, size, DOWNLOAD_BLOCK) if start not in state["done"]]
+        if state["done"]:
+            logger.info(f"Resuming {self.dest.name}, {len(blocks)} of {len(range(0, size, DOWNLOAD_BLOCK))} blocks left")
+
+        def fetch(start):
+            end = min(start + DOWNLOAD_BLOCK, size) - 1
+            headers = {"Range": f"bytes={start}-{end}"}
+            if etag and not etag.startswith("W/"): # If-Range needs a strong validator
+                headers["If-Range"] = etag
+            response = session.get(self.url, headers=headers, timeout=self.timeout)
+            if response.status_code != 206 or len(response.content) != end - start + 1:
+                raise Exception(f"Range request for {self.dest.name} failed: {response.status_code}")
+            with self.part.open("r+b") as fh:
+                fh.seek(start)
+                fh.write(response.content)
+            with self._lock:
+                state["done"].append(start)
+                self.state_file.write_text(json.dumps(state))
+
+        with ThreadPoolExecutor(self.connections) as pool:
+            list(pool.map(fetch, blocks))
+
+    def _single(self, session):
+        "Servers without range support: one plain streamed request, started over every time"
+        with session.get(self.url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            with self.part.open("wb") as fh:
+                for block in response.iter_content(1 << 20):
+                    fh.write(block)
+
+def fetch_model(model_file, url: Optional[str] = None, connections=4, sha256: Optional[str] = None) -> Path:
+    """
+    Return model_file once it exists and passes verification, downloading it from url
+    first if needed. A lock file makes concurrent callers, in this or other processes,
+    wait for a single download.
+    """
+    model_file = Path(model_file)
+    with file_lock(model_file.with_name(f"{model_file.name}.lock")):
+        if model_file.is_file():
+            if verify_model(model_file, sha256):
+                return model_file
+            logger.warning(f"Removing corrupt {model_file.name}")
+            model_file.unlink()
+        if not url:
+            raise Exception(f"{model_file.name} is not in the model store and has no download URL")
+        logger.warning(f"Downloading Silero {model_file.name} model...")
+        started = time.perf_counter()
+        _Download(url, model_file, connections).run()
+        logger.info(f"Model download completed in {time.perf_counter() - started:.1f}s")
+        if not verify_model(model_file, sha256):
+            model_file.unlink()
+            raise Exception(f"Downloaded {model_file.name} failed verification")
+        return model_file
+
+def _import(source, device):
+    # torch is imported on first load only, downloading and verifying don't need it
+    import torch.package
+    model = torch.package.PackageImporter(source).load_pickle("tts_models", "model")
+    model.to(device)
+    return model
+
+def load_package(model_file, device):
+    "Unpack a Silero torch.package model onto a device"
+    return _import(model_file, device)
+
+def benchmark(model_file, device="cpu", repeat=3) -> dict:
+    """
+    Time loads through the package and through an unpacked copy of it in a temporary
+    directory. A directory skips the zip reader, but torch refuses to load TorchScript
+    members from one and Silero packages contain them, so "unpacked" shows that error
+    instead of a time. The server only loads packages.
+    """
+    import torch
+    model_file = Path(model_file)
+    results = {}
+    with tempfile.TemporaryDirectory(dir=model_file.parent) as tmp:
+        with zipfile.ZipFile(model_file) as archive:
+            archive.extractall(tmp)
+        # torch archives keep every record under a single top level directory
+        entries = list(Path(tmp).iterdir())
+        unpacked = entries[0] if len(entries) == 1 and entries[0].is_dir() else Path(tmp)
+        for name, source in (("package", model_file), ("unpacked", unpacked)):
+            timings = []
+            try:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    _import(source, torch.device(device))
+                    timings.append(time.perf_counter() - started)
+            except Exception as e:
+                results[name] = {"error": str(e)}
+                continue
+            results[name] = {"best_s": min(timings), "mean_s": sum(timings) / len(timings)}
+    return results
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="silero_api_server.model_store", description="Verify downloaded models and measure their load times")
+    parser.add_argument("command", choices=["benchmark", "verify"])
+    parser.add_argument("models", nargs="+", help="Paths of downloaded .pt model packages")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for model in args.models:
+        if args.command == "verify":
+            print(model, "ok" if verify_model(model) else "corrupt")
+        else:
+            print(json.dumps({model: benchmark(model, args.device, args.repeat)}))
@@ -1,4 +1,6 @@
 import re
+import threading
+from functools import lru_cache
 from typing import List, Union, Optional
 from pymorphy3 import MorphAnalyzer
 from pymorphy3.analyzer import Parse
@@ -85,9 +87,15 @@ NUMBERS_UK = """0,нуль,нульовий
 1000000,мільйон,мільйонний"""
 
 class MorphProcessor:
-    def __init__(self, lang: str = "ru"):
+    def __init__(self, lang: str = "ru", cache_size: int = 4096):
         self.lang = lang
         self.morph = MorphAnalyzer(lang=lang)
+
+        # The same nouns get parsed and inflected for every number in every request.
+        # lru_cache is thread safe and keeps hit/miss statistics.
+        self._parse = lru_cache(maxsize=cache_size)(self._parse_uncached)
+        self._inflect = lru_cache(maxsize=cache_size)(self._inflect_uncached)
+        self._agree = lru_cache(maxsize=cache_size)(self._agree_uncached)
         self.num_data = NUMBERS_RU if lang == "ru" else NUMBERS_UK
         self.dict = {}
         for i in self.num_data.split("\n"):
@@ -101,12 +109,31 @@ class MorphProcessor:
         self.fem_map = {1: "одна", 2: "две"} if lang == "ru" else {1: "одна", 2: "дві"}
 
     def parse(self, word: str) -> Parse:
+        return self._parse(word)
+
+    def _parse_uncached(self, word: str) -> Parse:
         words: List[Parse] = self.morph.parse(word)
         for w in words:
             if w.tag.case == "nomn":
                 return w
         return words[0]
 
+    def _inflect_uncached(self, word: str, grammemes: frozenset) -> Optional[str]:
+        w_inf = self.parse(word).inflect(set(grammemes))
+        return w_inf.word if w_inf else None
+
+    def _agree_uncached(self, word: str, number: int) -> Optional[str]:
+        w2 = self.parse(word).make_agree_with_number(number)
+        return w2.word if w2 else None
+
+    def cache_stats(self) -> dict:
+        "Hit/miss statistics of the parse and inflection caches"
+        stats = {}
+        for name, cached in (("parse", self._parse), ("inflect", self._inflect), ("agree", self._agree)):
+            info = cached.cache_info()
+            stats[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+        return stats
+
     def integer_to_words(self, integer: int, text: str = None) -> list[str]:
         if integer < 0:
             minus = "мінус" if self.lang == "uk" else "минус"
@@ -163,11 +190,10 @@ class MorphProcessor:
                     # This logic is simplified; for large numbers it might need more work
                     base_val = 10**k
                     if base_val in self.dict:
-                        w2: Parse = self.parse(self.dict[base_val])
                         # make_agree_with_number doesn't always work perfectly for UK in pymorphy3, 
                         # but it's the best we have.
-                        w2 = w2.make_agree_with_number(digit)
-                        words.append(w2.word if w2 else self.dict[base_val])
+                        w2 = self._agree(self.dict[base_val], digit)
+                        words.append(w2 or self.dict[base_val])
 
             k -= 1
 
@@ -181,8 +207,8 @@ class MorphProcessor:
             grammemes = w.tag.numeral_agreement_grammemes(number)
             if grammemes == {"sing", "accs"}:
                 grammemes = {"sing", w.tag.case}
-            if w_inf := w.inflect(grammemes):
-                words.append(w_inf.word)
+            if w_inf := self._inflect(word, frozenset(grammemes)):
+                words.append(w_inf)
             else:
                 words.append(word)
         return words
@@ -326,13 +352,31 @@ class MorphProcessor:
         text = translit(text, self.lang)
         return text
 
-# Instances
-PROCESSORS = {
-    "ru": MorphProcessor("ru"),
-    "uk": MorphProcessor("uk")
-}
+# Instances, built on first use so processes that never normalize text never load the dictionaries
+PROCESSORS: dict[str, MorphProcessor] = {}
+_processors_lock = threading.Lock()
+
+def normalize_lang(lang_code: str) -> str:
+    return "uk" if lang_code in ["ua", "uk"] else "ru"
+
+def get_processor(lang_code: str = "ru") -> MorphProcessor:
+    lang = normalize_lang(lang_code)
+    processor = PROCESSORS.get(lang)
+    if processor is None:
+        with _processors_lock:
+            processor = PROCESSORS.get(lang)
+            if processor is None:
+                processor = PROCESSORS[lang] = MorphProcessor(lang)
+    return processor
+
+def preload(lang_codes: List[str]):
+    "Build processors up front, e.g. at startup, instead of on the first request"
+    for lang_code in lang_codes:
+        get_processor(lang_code)
+
+def cache_stats() -> dict:
+    "Morphology cache statistics for every language processor"
+    return {lang: processor.cache_stats() for lang, processor in PROCESSORS.items()}
 
 def apply_morphology(text: str, lang_code: str = "ru") -> str:
-    lang = "uk" if lang_code in ["ua", "uk"] else "ru"
-    processor = PROCESSORS.get(lang, PROCESSORS["ru"])
-    return processor.preprocess_text(text)
+    return get_processor(lang_code).preprocess_text(text)
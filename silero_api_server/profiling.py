@@ -0,0 +1,164 @@
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+import torch
+import torch.profiler
+from loguru import logger
+from silero_api_server.workers import ServiceBusy
+
+# Profile of the request running in the current context, None for untraced requests
+_active: ContextVar[Optional["RequestProfile"]] = ContextVar("silero_profile", default=None)
+
+# torch.profiler can't overlap with itself, so one request is profiled at a time
+_lock = threading.Lock()
+
+def active() -> bool:
+    return _active.get() is not None
+
+def current() -> Optional["RequestProfile"]:
+    "Profile of the current request, to hand to threads the context doesn't reach"
+    return _active.get()
+
+def record(stage: str, seconds: float):
+    "Add time to a stage of the current request's profile, if it has one"
+    profile = _active.get()
+    if profile is not None:
+        profile.record(stage, seconds)
+
+@contextmanager
+def trace(label: str):
+    "Run the enclosed block under torch.profiler when the current request is profiled"
+    profile = _active.get()
+    if profile is None:
+        yield
+        return
+    with profile.trace(label):
+        yield
+
+@contextmanager
+def span(stage: str):
+    "Time the enclosed block as a stage of the current profile only, without a metric"
+    if _active.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+class SamplingProfiler:
+    "Periodically records the Python stacks of every other thread, in collapsed (flamegraph) form"
+    def __init__(self, interval=0.002) -> None:
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_name} ({Path(frame.f_code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+class RequestProfile:
+    """
+    Runs one request under the sampling profiler and keeps a breakdown of the
+    pipeline stages it went through. Other threads are sampled too, so requests
+    running at the same time show up in the stacks. torch.profiler only sees ops
+    of the thread that started it, so each stage and inference batch of the
+    request is traced on its own thread as a separate section.
+    """
+    def __init__(self, directory=None, interval=0.002) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.directory = Path(directory) if directory else None
+        self.stages: defaultdict[str, float] = defaultdict(float)
+        self.total = 0.0
+        self.sampler = SamplingProfiler(interval)
+        self.torch_profiles: list[tuple[str, torch.profiler.profile]] = []
+        self._stages_lock = threading.Lock()
+        # Only one torch.profiler may run at a time, sections on other threads wait for it
+        self._trace_lock = threading.Lock()
+
+    @contextmanager
+    def run(self):
+        if not _lock.acquire(blocking=False):
+            raise ServiceBusy(1, "Another request is being profiled")
+        token = _active.set(self)
+        started = time.perf_counter()
+        self.sampler.start()
+        try:
+            yield self
+        finally:
+            self.total = time.perf_counter() - started
+            self.sampler.stop()
+            _active.reset(token)
+            _lock.release()
+
+    def record(self, stage: str, seconds: float):
+        with self._stages_lock:
+            self.stages[stage] += seconds
+
+    @contextmanager
+    def trace(self, label: str):
+        "Run the enclosed block under torch.profiler, on the calling thread"
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        with self._trace_lock:
+            with torch.profiler.profile(activities=activities) as torch_profile:
+                yield
+            self.torch_profiles.append((label, torch_profile))
+
+    def server_timing(self) -> str:
+        "Stage breakdown as a Server-Timing header value, durations in milliseconds"
+        stages = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        return ", ".join(stages + [f"total;dur={self.total * 1000:.1f}"])
+
+    def headers(self) -> dict:
+        return {"Server-Timing": self.server_timing(), "X-Profile-Id": self.id}
+
+    def summary(self) -> str:
+        lines = [f"profile {self.id}: {self.total * 1000:.1f} ms, {self.sampler.samples} samples"]
+        lines += [f"{stage:>16s} {seconds * 1000:10.1f} ms" for stage, seconds in sorted(self.stages.items(), key=lambda s: -s[1])]
+        for i, (label, torch_profile) in enumerate(self.torch_profiles):
+            lines += ["", f"[{i}] {label}", torch_profile.key_averages().table(sort_by="self_cpu_time_total", row_limit=30)]
+        return "\n".join(lines)
+
+    def save(self) -> Path:
+        "Write the summary, the sampled stacks and a torch trace per section to the profile directory. Blocking."
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}_{self.id}"
+        self.directory.joinpath(f"{name}.summary.txt").write_text(self.summary())
+        self.directory.joinpath(f"{name}.collapsed.txt").write_text(self.sampler.collapsed())
+        for i, (label, torch_profile) in enumerate(self.torch_profiles):
+            torch_profile.export_chrome_trace(str(self.directory.joinpath(f"{name}.{i}_{label}.torch.json")))
+        logger.info(f"Saved profile {self.id} to {self.directory}/{name}.*")
+        return self.directory.joinpath(name)
@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+from typing import Callable
+from loguru import logger
+
+class ModelRegistry:
+    """
+    Keep several models resident at once under a memory budget,
+    evicting the least recently used one when a new model doesn't fit
+    """
+    def __init__(self, loader: Callable, sizer: Callable, memory_budget_mb=2048, max_models=4) -> None:
+        # loader(model_id) -> model, sizer(model_id) -> approximate resident bytes
+        self.loader = loader
+        self.sizer = sizer
+        self.memory_budget = int(memory_budget_mb * 2**20)
+        self.max_models = max_models
+        self.pinned = set()
+        self.version = 0 # Bumped whenever the resident set changes
+        self._models: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: dict[str, threading.Lock] = {}
+
+    def get(self, model_id):
+        "Return a resident model, loading it (once, even with concurrent callers) if needed"
+        with self._lock:
+            if model_id in self._models:
+                self._models.move_to_end(model_id)
+                return self._models[model_id][0]
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if model_id in self._models:
+                    return self._models[model_id][0]
+            logger.info(f"Loading {model_id} into the model registry")
+            model = self.loader(model_id)
+            size = self.sizer(model_id)
+            with self._lock:
+                self._models[model_id] = (model, size)
+                self._evict(keep=model_id)
+                self.version += 1
+            return model
+
+    def resident(self) -> list[str]:
+        with self._lock:
+            return list(self._models)
+
+    def is_resident(self, model_id) -> bool:
+        with self._lock:
+            return model_id in self._models
+
+    def pin(self, model_id):
+        "Never evict model_id (the default model)"
+        with self._lock:
+            self.pinned = {model_id}
+
+    def memory_used(self) -> int:
+        with self._lock:
+            return sum(size for _, size in self._models.values())
+
+    def _evict(self, keep):
+        "Drop least recently used models until the budget fits. Caller holds the lock."
+        used = sum(size for _, size in self._models.values())
+        for model_id in list(self._models):
+            if used <= self.memory_budget and len(self._models) <= self.max_models:
+                break
+            if model_id == keep or model_id in self.pinned:
+                continue
+            _, size = self._models.pop(model_id)
+            used -= size
+            logger.info(f"Evicted {model_id} from the model registry")
@@ -0,0 +1,96 @@
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import md5
+from pathlib import Path
+from typing import Optional
+from loguru import logger
+
+class SampleStore:
+    """
+    Speaker previews stored as {path}/{model}/{sample text hash}/{speaker}.wav.
+    A sample is rendered the first time it is asked for, together with the rest
+    of the model's speakers in the background. Until a new version is complete,
+    requests get the sample of the previous version if there is one.
+    """
+    def __init__(self, service, path, workers=4) -> None:
+        self.service = service
+        self.path = Path(path)
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="samples")
+        self._pending: dict[Path, Future] = {}
+        self._lock = threading.Lock()
+
+    def version_path(self, model_id, text=None) -> Path:
+        digest = md5((text or self.service.sample_text).encode("utf-8")).hexdigest()[:12]
+        return self.path.joinpath(Path(model_id).stem, digest)
+
+    def get(self, speaker, model_id=None) -> Optional[Path]:
+        "Path of the sample to serve for speaker, None if the model has no such speaker"
+        model_id = model_id or self.service.current_model
+        if speaker not in self.service.get_speakers(model_id):
+            return None
+        file = self.version_path(model_id).joinpath(f"{speaker}.wav")
+        if file.exists():
+            return file
+        futures = self.refresh(model_id)
+        previous = self._previous(file)
+        if previous:
+            return previous
+        return futures[speaker].result()
+
+    def refresh(self, model_id=None) -> dict[str, Future]:
+        "Start rendering every missing sample of the current version, returning a future per speaker"
+        model_id = model_id or self.service.current_model
+        text = self.service.sample_text
+        version = self.version_path(model_id, text)
+        futures = {}
+        started = []
+        with self._lock:
+            for speaker in self.service.get_speakers(model_id):
+                file = version.joinpath(f"{speaker}.wav")
+                if file in self._pending:
+                    futures[speaker] = self._pending[file]
+                elif file.exists():
+                    futures[speaker] = Future()
+                    futures[speaker].set_result(file)
+                else:
+                    futures[speaker] = self._pending[file] = self._executor.submit(self._render, model_id, speaker, text, file)
+                    started.append((file, futures[speaker]))
+        # A render that already finished runs its callback right here, which takes the lock
+        for file, future in started:
+            future.add_done_callback(lambda future, file=file: self._finished(model_id, file, future))
+        return futures
+
+    def _render(self, model_id, speaker, text, file: Path) -> Path:
+        audio = self.service.generate(speaker, text, model_id=model_id).audio
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = file.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_bytes(audio)
+        os.replace(tmp, file)
+        return file
+
+    def _finished(self, model_id, file: Path, future: Future):
+        if future.exception():
+            logger.error(f"Rendering sample {file} failed: {future.exception()}")
+        with self._lock:
+            self._pending.pop(file, None)
+            if any(pending.parent == file.parent for pending in self._pending):
+                return
+        if not all(file.parent.joinpath(f"{speaker}.wav").exists() for speaker in self.service.get_speakers(model_id)):
+            return
+        # The version is complete, older ones of the same model are no longer served
+        logger.info(f"Samples ready in {file.parent}")
+        for version in file.parent.parent.iterdir():
+            if version.is_dir() and version != file.parent:
+                shutil.rmtree(version, ignore_errors=True)
+
+    def _previous(self, file: Path) -> Optional[Path]:
+        "The same speaker's sample from another version of the model, the newest one"
+        candidates = []
+        for candidate in file.parent.parent.glob(f"*/{file.name}"):
+            try:
+                candidates.append((candidate.stat().st_mtime, candidate))
+            except OSError: # Pruned meanwhile
+                continue
+        return max(candidates, default=(None, None))[1]
@@ -0,0 +1,152 @@
+import math
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from concurrent.futures import Future
+from typing import NamedTuple, Optional
+from loguru import logger
+from silero_api_server.workers import ServiceBusy
+from silero_api_server.metrics import BATCH_SIZE, STAGE_SECONDS
+from silero_api_server import profiling
+
+class InferenceRequest(NamedTuple):
+    model_id: str
+    speaker: str
+    sample_rate: int
+    text: str
+    future: Future
+    submitted: float = 0.0 # monotonic time of submit(), for queue wait metrics
+    profile: Optional[profiling.RequestProfile] = None # Set when the request submitting this is profiled
+
+    @property
+    def group(self):
+        "Requests sharing a group can run in the same forward pass"
+        return (self.model_id, self.speaker, self.sample_rate)
+
+class InferenceScheduler:
+    """
+    Collect sentences from concurrent callers for a few milliseconds, group
+    them by model, speaker and sample rate and hand each group as one batch
+    to the next free worker
+    """
+    def __init__(self, workers: list, max_batch_size=8, max_wait_ms=5.0, max_queue=256) -> None:
+        # Each worker provides infer(model_id, speaker, sample_rate, texts) -> list of audio tensors
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue = max_queue
+        self._queue: queue.Queue[Optional[InferenceRequest]] = queue.Queue()
+        self._batches: queue.Queue = queue.Queue()
+        self._pending = 0
+        self._seconds_per_item = 0.5 # Running estimate used for Retry-After
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._thread.start()
+        for i, worker in enumerate(workers):
+            threading.Thread(target=self._work, args=(worker,), name=f"inference-worker-{i}", daemon=True).start()
+
+    def submit(self, model_id, speaker, sample_rate, text, admitted=False) -> Future:
+        """
+        Queue text for synthesis. The future resolves to the audio tensor.
+        admitted skips the capacity check, for the rest of a stream that was already accepted.
+        """
+        if not admitted:
+            self.check_capacity()
+        with self._lock:
+            self._pending += 1
+        future = Future()
+        future.add_done_callback(self._done)
+        self._queue.put(InferenceRequest(model_id, speaker, sample_rate, text, future, time.monotonic(), profiling.current()))
+        return future
+
+    def check_capacity(self):
+        "Raise ServiceBusy when the queue is full"
+        with self._lock:
+            if self._pending >= self.max_queue:
+                retry_after = self._pending * self._seconds_per_item / max(len(self.workers), 1)
+                raise ServiceBusy(max(1, math.ceil(retry_after)))
+
+    def depth(self) -> int:
+        "Number of requests queued or running"
+        return self._pending
+
+    def close(self):
+        "Stop the scheduler, letting workers finish what is already queued"
+        self._queue.put(None)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _collect(self) -> list[InferenceRequest]:
+        "Block for the first request, then gather whatever arrives within the batching window"
+        pending = [self._queue.get()]
+        if pending[0] is None:
+            return pending
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(pending) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self):
+        while True:
+            groups = defaultdict(list)
+            for request in self._collect():
+                if request is None:
+                    for _ in self.workers:
+                        self._batches.put(None)
+                    return
+                if request.future.set_running_or_notify_cancel():
+                    groups[request.group].append(request)
+            for group, requests in groups.items():
+                # Spread a large group over the workers instead of queueing it all on one
+                size = max(1, math.ceil(len(requests) / len(self.workers)))
+                for i in range(0, len(requests), size):
+                    self._batches.put((group, requests[i:i + size]))
+
+    def _work(self, worker):
+        worker.start()
+        while (batch := self._batches.get()) is not None:
+            (model_id, speaker, sample_rate), requests = batch
+            started = time.monotonic()
+            for request in requests:
+                STAGE_SECONDS.labels("queue", model_id).observe(started - request.submitted)
+            BATCH_SIZE.labels(model_id).observe(len(requests))
+            # The profile's context doesn't reach this thread, profiled batches are traced here
+            profiles = {id(r.profile): r.profile for r in requests if r.profile is not None}
+            profile = next(iter(profiles.values()), None)
+            with profile.trace("inference") if profile else nullcontext():
+                self._run_batch(worker, model_id, speaker, sample_rate, requests)
+            elapsed = time.monotonic() - started
+            STAGE_SECONDS.labels("inference", model_id).observe(elapsed)
+            for request in requests:
+                if request.profile is not None:
+                    request.profile.record("queue", started - request.submitted)
+            for profile in profiles.values():
+                profile.record("inference", elapsed)
+            per_item = elapsed / len(requests)
+            self._seconds_per_item = 0.8 * self._seconds_per_item + 0.2 * per_item
+        worker.close()
+
+    def _run_batch(self, worker, model_id, speaker, sample_rate, requests: list[InferenceRequest]):
+        try:
+            results = worker.infer(model_id, speaker, sample_rate, [r.text for r in requests])
+        except Exception as e:
+            if len(requests) > 1:
+                # Retry one by one so a single bad input doesn't fail its neighbours
+                for request in requests:
+                    self._run_batch(worker, model_id, speaker, sample_rate, [request])
+                return
+            logger.error(f"Synthesis for {speaker} failed: {e}")
+            requests[0].future.set_exception(e)
+            return
+        for request, audio in zip(requests, results):
+            request.future.set_result(audio)
@@ -1,32 +1,58 @@
 
+import base64
+import json
 import pathlib
 import os
+import re
+import secrets
+import threading
+import zipfile
+from contextlib import asynccontextmanager, nullcontext
 from fastapi import FastAPI, Response, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
-from silero_api_server.tts import SileroTtsService
+from silero_api_server.tts import SileroTtsService, UnknownModel
+from silero_api_server.audio import MEDIA_TYPES
+from silero_api_server.workers import ServiceBusy
+from silero_api_server import metrics, morph_utils, profiling
 from loguru import logger
 from typing import Optional
 
 module_path = pathlib.Path(__file__).resolve().parent
 os.chdir(module_path)
 SAMPLE_PATH = pathlib.Path("samples")
+# OpenAI model names, which stand for the default model
+OPENAI_MODELS = ("tts-1", "tts-1-hd", "gpt-4o-mini-tts")
+BATCH_ARCHIVES = ("ndjson", "zip")
+MAX_BATCH_ITEMS = 1000
 
 tts_service = SileroTtsService(f"{module_path}//{SAMPLE_PATH}")
-app = FastAPI()
+metrics.track_service(tts_service)
+
+def startup(model_id):
+    "Load the model once. Samples are rendered when first asked for."
+    tts_service.start(model_id)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load in the background so /health/live answers while the model is loading
+    threading.Thread(target=startup, args=(app.state.model_id,), name="startup", daemon=True).start()
+    yield
+
+app = FastAPI(lifespan=lifespan)
+# Model loaded at startup, __main__ overrides it from the command line
+app.state.model_id = "v5_ru.pt"
+# Requests may ask to be profiled only with this token, profiling is off without one
+app.state.admin_token = os.environ.get("SILERO_ADMIN_TOKEN", "")
+# Where profiles are saved, empty to only return the stage breakdown in headers
+app.state.profile_dir = "profiles"
 
 # Make sure the samples directory exists
 if not SAMPLE_PATH.exists():
     SAMPLE_PATH.mkdir()
 
-if len(list(SAMPLE_PATH.iterdir())) == 0:
-    logger.info("Samples empty, generating new samples.")
-    tts_service.generate_samples()
-
-app.mount(f"/samples",StaticFiles(directory=module_path.joinpath(SAMPLE_PATH)),name='samples')
 origins = ["*"]
 
 app.add_middleware(
@@ -37,10 +63,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ServiceBusy)
+def service_busy(request: Request, exc: ServiceBusy):
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(UnknownModel)
+def unknown_model(request: Request, exc: UnknownModel):
+    return JSONResponse({"detail": str(exc)}, status_code=400)
+
 class Voice(BaseModel):
     speaker: str
     text: str
     session: Optional[str] = None
+    stream: Optional[bool] = False
+    model: Optional[str] = None
+    language: Optional[str] = None
+    response_format: Optional[str] = "wav"
+    sample_rate: Optional[int] = None
+
+class BatchItem(BaseModel):
+    speaker: str
+    text: str
+    id: Optional[str] = None
+    model: Optional[str] = None
+    language: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    items: list[BatchItem]
+    response_format: Optional[str] = "wav"
+    sample_rate: Optional[int] = None
+    archive: Optional[str] = "ndjson"
 
 class SampleText(BaseModel):
     text: Optional[str]
@@ -57,41 +109,213 @@ class OpenAI_Speech_Request(BaseModel):
     voice: Optional[str] = "baya"
     response_format: Optional[str] = "mp3"
     speed: Optional[float] = 1.0
+    stream: Optional[bool] = False
+    sample_rate: Optional[int] = None
+
+def check_audio_options(response_format, sample_rate):
+    if response_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"response_format must be one of {list(MEDIA_TYPES)}")
+    if sample_rate is not None and not 4000 <= sample_rate <= 48000:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 4000 and 48000")
+
+def request_profile(request: Request) -> Optional[profiling.RequestProfile]:
+    "A profile for requests asking for one with X-Profile or ?profile=1, which needs the admin token"
+    if not (request.headers.get("x-profile") or request.query_params.get("profile")):
+        return None
+    token = app.state.admin_token
+    if not token or not secrets.compare_digest(request.headers.get("x-admin-token", ""), token):
+        raise HTTPException(status_code=403, detail="Profiling requires the admin token")
+    return profiling.RequestProfile(app.state.profile_dir)
+
+def audio_response(request: Request, result, profile: Optional[profiling.RequestProfile] = None):
+    "Serve generated audio with an ETag, answering conditional requests with 304"
+    etag = f'"{result.etag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if profile:
+        headers.update(profile.headers())
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(result.audio, media_type=result.media_type, headers=headers)
+
+async def stream_response(speaker, text, session="", model_id=None, response_format="wav", sample_rate=None):
+    """
+    Stream generated audio. Errors after the status line only truncate the body, so the
+    speaker is checked and the first sentence synthesized before the response starts.
+    """
+    tts_service.require_ready()
+    tts_service.scheduler.check_capacity()
+    if speaker not in await tts_service.aget_speakers(model_id):
+        raise HTTPException(status_code=400, detail=f"Unknown speaker {speaker} for {model_id}")
+    chunks = tts_service.agenerate_stream(speaker, text, session, model_id, response_format, sample_rate)
+    try:
+        first = await anext(chunks, b"")
+    except ServiceBusy:
+        raise
+    except Exception as e:
+        logger.error(e)
+        raise HTTPException(status_code=500, detail=f"{speaker} generation failed: {e}")
+
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[response_format])
+
+class _ZipStream:
+    "Unseekable file for zipfile, handing out what was written since the last read"
+    def __init__(self) -> None:
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self) -> bytes:
+        data = bytes(self.data)
+        self.data.clear()
+        return data
+
+async def batch_ndjson(results, ids):
+    "One JSON line per item with base64 audio or its error, then a summary line"
+    failed = 0
+    async for index, result, error in results:
+        line = {"id": ids[index], "index": index}
+        if error:
+            failed += 1
+            line["error"] = str(error)
+        else:
+            line.update(media_type=result.media_type, etag=result.etag, audio=base64.b64encode(result.audio).decode("ascii"))
+        yield json.dumps(line) + "\n"
+    yield json.dumps({"done": True, "succeeded": len(ids) - failed, "failed": failed}) + "\n"
+
+async def batch_zip(results, ids, response_format):
+    "A zip with one file per item, stored uncompressed as it is written, and an index.json of files and errors"
+    stream = _ZipStream()
+    entries = []
+    files = set()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as archive:
+        async for index, result, error in results:
+            entry = {"id": ids[index], "index": index}
+            if error:
+                entry["error"] = str(error)
+            else:
+                name = re.sub(r'[^A-Za-z0-9._-]', '_', ids[index])
+                # Ids differing only in characters not allowed in file names keep their own files
+                file = f"{name}.{response_format}"
+                attempt = 0
+                while file in files:
+                    file = f"{name}_{index}{f'_{attempt}' if attempt else ''}.{response_format}"
+                    attempt += 1
+                files.add(file)
+                entry["file"] = file
+                archive.writestr(file, result.audio)
+            entries.append(entry)
+            yield stream.read()
+        archive.writestr("index.json", json.dumps(sorted(entries, key=lambda entry: entry["index"]), indent=1))
+    yield stream.read()
+
+@app.get("/health/live")
+async def health_live():
+    return JSONResponse({"status": "live"}, status_code=200)
+
+@app.get("/health/ready")
+async def health_ready():
+    if tts_service.ready.is_set():
+        return JSONResponse({"status": "ready", "model": tts_service.current_model}, status_code=200)
+    if tts_service.startup_error:
+        return JSONResponse({"status": "failed", "detail": str(tts_service.startup_error)}, status_code=503)
+    return JSONResponse({"status": "loading"}, status_code=503)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    data, content_type = metrics.render()
+    return Response(data, media_type=content_type)
 
 @app.get("/tts/speakers")
-def speakers(request: Request):
+async def speakers(request: Request, model: Optional[str] = None, language: Optional[str] = None):
+    model_id = tts_service.resolve_model(model, language)
     voices = [
         {
             "name":speaker,
             "voice_id":speaker,
-            "preview_url": f"{str(request.base_url)}{SAMPLE_PATH}/{speaker}.wav"
-        } for speaker in tts_service.get_speakers()
+            "preview_url": f"{str(request.base_url)}{SAMPLE_PATH}/{speaker}.wav?model={model_id}"
+        } for speaker in await tts_service.aget_speakers(model_id)
     ]
     return voices
 
 @app.post("/tts/generate")
-def generate(voice: Voice):
+async def generate(voice: Voice, request: Request):
     # Clean elipses
     voice.text = voice.text.replace("*","")
+    model_id = tts_service.resolve_model(voice.model, voice.language)
+    check_audio_options(voice.response_format, voice.sample_rate)
+    profile = request_profile(request)
+    if voice.stream:
+        if profile:
+            raise HTTPException(status_code=400, detail="Streamed responses can't be profiled")
+        return await stream_response(voice.speaker, voice.text, voice.session, model_id, voice.response_format, voice.sample_rate)
     try:
-        if voice.session:
-            audio = tts_service.generate(voice.speaker, voice.text, voice.session)
-        else:
-            audio = tts_service.generate(voice.speaker, voice.text)
-        return FileResponse(audio)
+        with profile.run() if profile else nullcontext():
+            if voice.session:
+                result = await tts_service.agenerate(voice.speaker, voice.text, voice.session, model_id, voice.response_format, voice.sample_rate)
+            else:
+                result = await tts_service.agenerate(voice.speaker, voice.text, model_id=model_id, response_format=voice.response_format, sample_rate=voice.sample_rate)
+        if profile and profile.directory:
+            await tts_service.run_async(profile.save)
+        return audio_response(request, result, profile)
+    except ServiceBusy:
+        raise
     except Exception as e:
         logger.error(e)
-        return HTTPException(500,f"{voice.speaker} generation failed: {e}")
+        raise HTTPException(status_code=500, detail=f"{voice.speaker} generation failed: {e}")
     
+@app.post("/tts/batch")
+async def batch(batch: BatchRequest):
+    "Generate many items in one request, streaming each as it finishes in the order they finish"
+    check_audio_options(batch.response_format, batch.sample_rate)
+    if batch.archive not in BATCH_ARCHIVES:
+        raise HTTPException(status_code=400, detail=f"archive must be one of {list(BATCH_ARCHIVES)}")
+    if not 0 < len(batch.items) <= MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch takes 1 to {MAX_BATCH_ITEMS} items")
+    ids = [item.id or str(i) for i, item in enumerate(batch.items)]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Item ids must be unique")
+    # Turn the whole batch away now, afterwards a full queue only delays items
+    tts_service.require_ready()
+    tts_service.scheduler.check_capacity()
+    items = []
+    for item_id, item in zip(ids, batch.items):
+        try:
+            items.append((item.speaker, item.text.replace("*",""), tts_service.resolve_model(item.model, item.language)))
+        except UnknownModel as e:
+            raise HTTPException(status_code=400, detail=f"Item {item_id}: {e}")
+    results = tts_service.agenerate_batch(items, batch.response_format, batch.sample_rate)
+    if batch.archive == "zip":
+        return StreamingResponse(batch_zip(results, ids, batch.response_format), media_type="application/zip",
+                                 headers={"Content-Disposition": 'attachment; filename="batch.zip"'})
+    return StreamingResponse(batch_ndjson(results, ids), media_type="application/x-ndjson")
+
 @app.get("/tts/sample")
-def play_sample(speaker: str):
-    return FileResponse(f"{SAMPLE_PATH}/{speaker}.wav",status_code=200)
+async def play_sample(speaker: str, model: Optional[str] = None):
+    # Waits for the sample to render when no older version of it exists
+    sample = await tts_service.run_async(tts_service.samples.get, speaker, tts_service.resolve_model(model))
+    if not sample:
+        raise HTTPException(status_code=404, detail=f"Unknown speaker {speaker}")
+    return FileResponse(sample,status_code=200)
+
+@app.get("/samples/{file_name}")
+async def sample_file(file_name: str, model: Optional[str] = None):
+    return await play_sample(file_name.removesuffix(".wav"), model)
 
 @app.post("/tts/generate-samples")
-def generate_samples(sample_text: Optional[str] = ""):
+async def generate_samples(sample_text: Optional[str] = "", model: Optional[str] = None):
     tts_service.update_sample_text(sample_text)
-    tts_service.generate_samples()
-    return Response("Generated samples",status_code=200)
+    await tts_service.run_async(tts_service.generate_samples, tts_service.resolve_model(model))
+    return Response("Generating samples",status_code=202)
 
 @app.post("/tts/session")
 def init_session(sessionPayload: SessionPayload):
@@ -102,18 +326,44 @@ def init_session(sessionPayload: SessionPayload):
 def get_models():
     return JSONResponse(list(tts_service.langs.keys()),status_code=200)
 
+@app.get("/tts/model/resident")
+def get_resident_models():
+    return JSONResponse({
+        "default": tts_service.current_model,
+        "resident": tts_service.registry.resident(),
+        "memory_used": tts_service.registry.memory_used(),
+        "memory_budget": tts_service.registry.memory_budget,
+    },status_code=200)
+
 @app.post("/tts/model")
-def set_model(model: ModelSelection):
-    tts_service.load_model(model.id)
+async def set_model(model: ModelSelection):
+    await tts_service.run_async(tts_service.load_model, model.id)
     return Response(status_code=200)
 
+@app.get("/tts/morphology/cache")
+def morphology_cache():
+    return JSONResponse(morph_utils.cache_stats(),status_code=200)
+
 @app.post("/v1/audio/speech")
-def openai_speech(request: OpenAI_Speech_Request):
+async def openai_speech(request: OpenAI_Speech_Request, http_request: Request):
     # Clean ellipses
     text = request.input.replace("*","")
+    # OpenAI model names (tts-1, tts-1-hd, gpt-4o-mini-tts) fall back to the default model
+    model_id = tts_service.resolve_model(None if request.model in OPENAI_MODELS else request.model)
+    check_audio_options(request.response_format, request.sample_rate)
+    profile = request_profile(http_request)
+    if request.stream:
+        if profile:
+            raise HTTPException(status_code=400, detail="Streamed responses can't be profiled")
+        return await stream_response(request.voice, text, model_id=model_id, response_format=request.response_format, sample_rate=request.sample_rate)
     try:
-        audio = tts_service.generate(request.voice, text)
-        return FileResponse(audio)
+        with profile.run() if profile else nullcontext():
+            result = await tts_service.agenerate(request.voice, text, model_id=model_id, response_format=request.response_format, sample_rate=request.sample_rate)
+        if profile and profile.directory:
+            await tts_service.run_async(profile.save)
+        return audio_response(http_request, result, profile)
+    except ServiceBusy:
+        raise
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=500, detail=f"Generation failed: {e}")
@@ -0,0 +1,107 @@
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, Optional
+from loguru import logger
+from silero_api_server import metrics
+
+SESSION_MODES = ("files", "append")
+
+class SessionAudio(NamedTuple):
+    session: str
+    speaker: str
+    response_format: str
+    audio: bytes
+    model_id: str = ""
+    cache_file: Optional[Path] = None # On-disk cache copy of the same bytes, hard linked when possible
+
+class SessionWriter:
+    """
+    Persist session audio on a background thread so requests never wait on disk.
+    In "files" mode every utterance gets its own file, hard linked from the
+    synthesis cache when it has the same bytes on the same filesystem. In
+    "append" mode a session is one growing audio.dat with an index.jsonl
+    giving the offset, length and metadata of every utterance.
+    """
+    def __init__(self, path=None, mode="files", max_queue=1024) -> None:
+        if mode not in SESSION_MODES:
+            raise Exception(f"Unknown session mode {mode}, expected one of {list(SESSION_MODES)}")
+        self.path = Path(path) if path else None
+        self.mode = mode
+        self._queue: queue.Queue[Optional[SessionAudio]] = queue.Queue(max_queue)
+        self._sequence = 0
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: SessionAudio):
+        "Queue audio for writing, blocking only when the writer is max_queue items behind"
+        if not self.path:
+            raise Exception(r"Session not initialized. Call /tts/init_session with {'path':'desired\session\path'}")
+        self._queue.put(item)
+
+    def flush(self):
+        "Wait until everything queued so far is on disk"
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while (item := self._queue.get()) is not None:
+            try:
+                with metrics.stage("session_io", item.model_id):
+                    self._write(item)
+            except Exception as e:
+                logger.error(f"Failed to save audio of session {item.session}: {e}")
+            finally:
+                self._queue.task_done()
+        self._queue.task_done()
+
+    def _write(self, item: SessionAudio):
+        session_path = self.path.joinpath(item.session)
+        session_path.mkdir(parents=True, exist_ok=True)
+        if self.mode == "append":
+            self._append(session_path, item)
+            return
+        # Nanoseconds and a sequence number keep names unique within the same second
+        self._sequence += 1
+        dst = session_path.joinpath(f"tts_{item.session}_{time.time_ns()}_{self._sequence}_{item.speaker}_.{item.response_format}")
+        if item.cache_file:
+            try:
+                os.link(item.cache_file, dst)
+                return
+            except OSError: # Evicted meanwhile, or on another filesystem
+                pass
+        dst.write_bytes(item.audio)
+
+    def _append(self, session_path: Path, item: SessionAudio):
+        container = session_path.joinpath("audio.dat")
+        with container.open("ab") as fh:
+            offset = fh.tell()
+            fh.write(item.audio)
+        entry = {
+            "offset": offset,
+            "length": len(item.audio),
+            "speaker": item.speaker,
+            "format": item.response_format,
+            "model": item.model_id,
+            "time": time.time(),
+        }
+        with session_path.joinpath("index.jsonl").open("a") as fh:
+            fh.write(json.dumps(entry) + "\n")
+
+def read_session(session_path) -> list[tuple[dict, bytes]]:
+    "Every utterance of an append mode session as (index entry, audio bytes)"
+    session_path = Path(session_path)
+    with session_path.joinpath("index.jsonl").open() as fh:
+        entries = [json.loads(line) for line in fh if line.strip()]
+    with session_path.joinpath("audio.dat").open("rb") as fh:
+        utterances = []
+        for entry in entries:
+            fh.seek(entry["offset"])
+            utterances.append((entry, fh.read(entry["length"])))
+    return utterances
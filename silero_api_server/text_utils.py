@@ -0,0 +1,56 @@
+import re
+
+# Clause boundary: comma, semicolon, colon or dash followed by whitespace
+CLAUSE_END = re.compile(r'(?<=[,;:—–])\s+')
+
+# Sentence end: terminal punctuation (optionally followed by closing quotes/brackets) and whitespace
+SENTENCE_END = re.compile(r'(?:(?<=[.!?…])|(?<=[.!?…]["»)\]]))\s+')
+
+def split_words(text: str, max_length: int) -> list[str]:
+    "Split text on spaces into chunks no longer than max_length"
+    chunks = []
+    chunk = ""
+    for word in text.split():
+        if chunk and len(chunk) + len(word) + 1 > max_length:
+            chunks.append(chunk)
+            chunk = ""
+        chunk = f"{chunk} {word}" if chunk else word
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def split_clauses(sentence: str, max_length: int) -> list[str]:
+    "Split an overlong sentence on clause boundaries, packing clauses back up to max_length"
+    chunks = []
+    chunk = ""
+    for clause in CLAUSE_END.split(sentence):
+        if len(clause) > max_length:
+            if chunk:
+                chunks.append(chunk)
+                chunk = ""
+            chunks += split_words(clause, max_length)
+            continue
+        if chunk and len(chunk) + len(clause) + 1 > max_length:
+            chunks.append(chunk)
+            chunk = ""
+        chunk = f"{chunk} {clause}" if chunk else clause
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def chunk_text(text: str, max_length: int = 600) -> list[tuple[str, bool]]:
+    """
+    Split text into synthesis chunks on sentence and clause boundaries.
+    Returns (chunk, ends_sentence) pairs so callers can pick the pause after each chunk.
+    """
+    chunks = []
+    for sentence in SENTENCE_END.split(text.replace("\n", " ")):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) <= max_length:
+            chunks.append((sentence, True))
+            continue
+        pieces = split_clauses(sentence, max_length)
+        chunks += [(piece, i == len(pieces) - 1) for i, piece in enumerate(pieces)]
+    return chunks
@@ -1,16 +1,38 @@
 # V3
-import os, time
+import time
 import shutil
-import requests
+import asyncio
+import contextvars
+import functools
+import threading
 import torch
-import torch.package
 import torchaudio
-from hashlib import md5
+import numpy as np
 from loguru import logger
-from pydub import AudioSegment
 from pathlib import Path
-import json
+import inspect
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Iterator, NamedTuple, Optional
 from silero_api_server.morph_utils import apply_morphology
+from silero_api_server.audio import MEDIA_TYPES, StreamEncoder, assemble, check_format, closest_rate, encode, encoder_rate, resample, silence, to_numpy
+from silero_api_server.text_utils import chunk_text
+from silero_api_server.cache import SynthesisCache
+from silero_api_server.scheduler import InferenceScheduler
+from silero_api_server.workers import ServiceBusy, ServiceNotReady, create_workers, run_tts
+from silero_api_server.model_store import default_model_dir, fetch_model, load_package
+from silero_api_server.registry import ModelRegistry
+from silero_api_server.model_index import ModelIndex
+from silero_api_server.samples import SampleStore
+from silero_api_server.sessions import SessionAudio, SessionWriter
+from silero_api_server import metrics, profiling
+
+class UnknownModel(ValueError):
+    "Raised when a request names a model or language no known model provides"
+
+class AudioResult(NamedTuple):
+    audio: bytes
+    etag: str
+    media_type: str = "audio/wav"
 
 class SileroTtsService:
     """
@@ -20,133 +42,405 @@ class SileroTtsService:
         self.sample_text = "Удалена библиотека torchvision (так как для TTS она не требуется, а только скачивает лишние мегабайты)."
         self.sample_path = Path(sample_path)
         self.sessions_path = None
+        # Session audio is written in the background, requests only queue it
+        self.session_writer = SessionWriter()
         self.current_model = model_id
+        self.langs = {}
+        # Where langs comes from, kept on disk and revalidated in the background
+        self.model_index = ModelIndex()
+
+        # Set once start() has loaded the first model
+        self.ready = threading.Event()
+        self.startup_error = None
 
         # Silero works fine on CPU, but use CUDA if available
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        torch.set_num_threads(4)
         torchaudio.set_audio_backend("soundfile")
 
         # Make sure we have the sample path
         if not self.sample_path.exists():
             self.sample_path.mkdir()   
+        self.samples = SampleStore(self, self.sample_path)
 
+        # Default output rate, requests may ask for another one
         self.sample_rate = 48000 
-        logger.info(f"TTS Service loaded successfully")
+
+        # Downloaded models are shared by every install through this directory
+        self.model_dir = default_model_dir()
+        self.download_connections = 4
+        self._model_files: dict[str, Path] = {} # Models already verified by this process
+
+        # Models kept resident side by side, current_model is the default for requests that don't pick one
+        self.registry = ModelRegistry(self.load_model_object, self.model_size)
+
+        # Cache of generated audio, keyed by everything that determines it
+        self.cache = SynthesisCache()
+
+        # Audio of single sentences at the native rate, so texts sharing sentences only synthesize the new ones
+        self.segments = SynthesisCache("", memory_items=4096, memory_bytes=32 << 20, name="segment")
+
+        # All inference goes through the scheduler so concurrent callers get batched together
+        self.scheduler = InferenceScheduler(create_workers(self))
+
+        # Blocking work behind the async API, so no event loop ever waits on it
+        self.executor = ThreadPoolExecutor(32, thread_name_prefix="tts")
 
         # Prevent generation failure due to too long input
         self.max_char_length = 600
 
-        # Get language model URLs
-        self.langs = self.list_languages()
+        # Pauses inserted between separately synthesized sentences and clauses
+        self.sentence_pause_ms = 150
+        self.clause_pause_ms = 60
 
-        # Load model
-        self.load_model(model_id)
+    def start(self, model_id=None):
+        "Fetch the model index and load the model, exactly once per process start"
+        model_id = model_id or self.current_model
+        try:
+            # Only wait for the index when the model still has to be downloaded
+            self.langs = self.list_languages(block=not self.model_path(model_id).is_file())
+            self.load_model(model_id)
+        except Exception as e:
+            self.startup_error = e
+            logger.error(f"Startup failed: {e}")
+            raise
+        self.ready.set()
+        logger.info(f"TTS Service ready with {self.current_model}")
+
+    def require_ready(self):
+        if not self.ready.is_set():
+            raise ServiceNotReady()
 
     def init_sessions_path(self, sessions_path="sessions"):
         self.sessions_path = Path(sessions_path)
         if not self.sessions_path.exists():
             self.sessions_path.mkdir()
+        self.session_writer.path = self.sessions_path
     
-    def load_model(self, model_id="v5_ru.pt"):
-        # Download the model. Default to ru.
-        if model_id not in self.langs:
+    def init_cache(self, path="cache", memory_mb=64, disk_mb=512):
+        self.cache = SynthesisCache(path, memory_bytes=int(memory_mb * 2**20), disk_bytes=int(disk_mb * 2**20))
+
+    def init_segment_cache(self, memory_mb=32):
+        "Size the sentence segment cache, 0 disables it"
+        self.segments = SynthesisCache("", memory_items=4096, memory_bytes=int(memory_mb * 2**20), name="segment") if memory_mb else None
+
+    def init_workers(self, count=1, mode="thread", threads=4, max_queue=256):
+        "Replace the inference workers. Call before serving traffic."
+        old = self.scheduler
+        self.scheduler = InferenceScheduler(create_workers(self, count, mode, threads),
+                                            old.max_batch_size, old.max_wait_ms, max_queue)
+        old.close()
+
+    def init_registry(self, memory_budget_mb=2048, max_models=4):
+        self.registry.memory_budget = int(memory_budget_mb * 2**20)
+        self.registry.max_models = max_models
+
+    def model_path(self, model_id) -> Path:
+        return self.model_dir.joinpath(model_id)
+
+    def model_size(self, model_id) -> int:
+        "Approximate resident size of a model, taken from its package size"
+        return self.model_path(model_id).stat().st_size
+
+    def model_language(self, model_id) -> str:
+        "Language directory of a model, e.g. ru for v5_ru.pt"
+        if model_id in self.langs:
+            return self.langs[model_id].rstrip("/").split("/")[-2]
+        return Path(model_id).stem.split("_")[-1]
+
+    def resolve_model(self, model=None, language=None) -> str:
+        """
+        Pick the model for a request: an explicit model id, else the newest model for the language,
+        else the default. Raises UnknownModel when the requested model or language isn't available.
+        """
+        if model:
+            for candidate in (model, f"{model}.pt"):
+                # Models already loaded or downloaded work even while the index is missing them
+                if candidate in self.langs or self.registry.is_resident(candidate) or self.model_path(candidate).is_file():
+                    return candidate
+            raise UnknownModel(f"Unknown model {model}")
+        if language:
+            # uk-UA, uk_UA or UK -> uk, which Silero keeps in its ua directory
+            language = language.split("-")[0].split("_")[0].lower()
+            language = "ua" if language == "uk" else language
+            if self.model_language(self.current_model) == language:
+                return self.current_model
+            candidates = sorted(m for m in self.langs if self.model_language(m) == language)
+            if candidates:
+                return candidates[-1]
+            raise UnknownModel(f"No model for language {language}")
+        return self.current_model
+
+    @property
+    def model(self):
+        "The default model"
+        return self.registry.get(self.current_model)
+
+    def download_model(self, model_id) -> Path:
+        "Download the model into the model store if needed, verify it and return its path"
+        if model_id in self._model_files:
+            return self._model_files[model_id]
+        if Path(model_id).name != model_id:
+            raise Exception(f"Invalid model id {model_id}")
+        model_file = self.model_path(model_id)
+        legacy_file = Path(model_id) # Downloaded into the working directory by older versions
+        if not model_file.exists() and legacy_file.is_file() and legacy_file.resolve() != model_file.resolve():
+            logger.info(f"Moving {legacy_file.resolve()} into the model store {self.model_dir}")
+            self.model_dir.mkdir(parents=True, exist_ok=True)
+            shutil.move(legacy_file, model_file)
+        if not model_file.is_file() and model_id not in self.langs:
             raise Exception(f"{model_id} not in {list(self.langs.keys())}")
-        
-        model_url = self.langs[model_id]
-        self.model_file = Path(model_id)
-
-        if not Path.is_file(self.model_file):
-            logger.warning(f"Downloading Silero {model_id} model...") 
-            torch.hub.download_url_to_file(model_url,
-                                        self.model_file)  
-            logger.info(f"Model download completed.")
-        
+        self._model_files[model_id] = fetch_model(model_file, self.langs.get(model_id), self.download_connections)
+        return self._model_files[model_id]
+
+    def load_model_object(self, model_id):
+        return load_package(self.download_model(model_id), self.device)
+
+    def load_model(self, model_id="v5_ru.pt"):
+        "Make model_id resident and the default. Other resident models stay loaded."
+        self.registry.get(model_id)
+        self.registry.pin(model_id)
         self.current_model = model_id
-        self.model = torch.package.PackageImporter(self.model_file).load_pickle("tts_models", "model")
-        self.model.to(self.device)
 
-    def generate(self, speaker, text, session=""):
-        # Apply morphology and transliteration for Russian and Ukrainian
+    def prepare_text(self, text, model_id=None):
+        "Apply morphology and transliteration for Russian and Ukrainian"
+        model_id = model_id or self.current_model
         lang_code = None
-        if "_ru" in self.current_model:
+        if "_ru" in model_id:
             lang_code = "ru"
-        elif "_ua" in self.current_model or "_uk" in self.current_model:
+        elif "_ua" in model_id or "_uk" in model_id:
             lang_code = "uk"
-            
+
         if lang_code:
             logger.debug(f"Applying morphology ({lang_code}) to: {text}")
-            text = apply_morphology(text, lang_code)
+            with metrics.stage("morphology", model_id):
+                text = apply_morphology(text, lang_code)
             logger.debug(f"Morphed text: {text}")
+        return text
 
-        if len(text) > self.max_char_length:
-            # Handle long text input
-            text_chunks = self.split_text(text)
-            combined_wav = AudioSegment.empty()
+    def infer_batch(self, model_id, speaker, sample_rate, texts: list[str]) -> list[torch.Tensor]:
+        "Run one scheduler batch through the model"
+        model = self.registry.get(model_id)
+        # Older Silero packages accept a list of texts and pad them into one forward pass
+        if len(texts) > 1 and "texts" in inspect.signature(model.apply_tts).parameters:
+            with torch.no_grad():
+                return [audio.cpu() for audio in model.apply_tts(texts=texts, speaker=speaker, sample_rate=sample_rate)]
+        return run_tts(model, speaker, sample_rate, texts)
 
-            for chunk in text_chunks:
-                audio_path = Path(self.model.save_wav(text=chunk,speaker=speaker,sample_rate=self.sample_rate))
-                combined_wav += AudioSegment.silent(500) # Insert 500ms pause
-                combined_wav += AudioSegment.from_file(audio_path)
+    def submit(self, speaker, text, model_id=None, sample_rate=None, admitted=False):
+        "Queue prepared text on the scheduler, returning a future for its audio at a native model rate"
+        self.require_ready()
+        return self.scheduler.submit(model_id or self.current_model, speaker, closest_rate(sample_rate or self.sample_rate), text, admitted)
 
-            combined_wav.export("test.wav", format="wav")
-            audio_path = Path("test.wav")
+    def submit_segment(self, speaker, text, model_id=None, sample_rate=None, admitted=False) -> Future:
+        "Like submit, but answered from the segment cache when the same chunk was synthesized before"
+        if self.segments is None or profiling.active():
+            return self.submit(speaker, text, model_id, sample_rate, admitted)
+        key = self.segments.make_key(model_id or self.current_model, speaker, closest_rate(sample_rate or self.sample_rate), text)
+        data = self.segments.get(key)
+        if data is not None:
+            future = Future()
+            future.set_result(torch.from_numpy(np.frombuffer(data, dtype=np.float32).copy()))
+            return future
+
+        def remember(future):
+            if not future.exception():
+                self.segments.put(key, to_numpy(future.result()).tobytes())
+        future = self.submit(speaker, text, model_id, sample_rate, admitted)
+        future.add_done_callback(remember)
+        return future
+
+    def chunk(self, text) -> list[tuple[str, int]]:
+        "Split prepared text into (chunk, pause before it in ms) pairs"
+        chunks = []
+        pause = 0
+        for chunk, ends_sentence in chunk_text(text, self.max_char_length):
+            chunks.append((chunk, pause))
+            pause = self.sentence_pause_ms if ends_sentence else self.clause_pause_ms
+        return chunks
+
+    def synthesize(self, speaker, text, model_id=None, sample_rate=None):
+        "Run the model on already prepared text and return the audio at sample_rate"
+        model_id = model_id or self.current_model
+        sample_rate = sample_rate or self.sample_rate
+        native_rate = closest_rate(sample_rate)
+        if len(text) <= self.max_char_length and self.segments is None:
+            future = self.submit(speaker, text, model_id, sample_rate)
+            with profiling.span("inference_wait"):
+                audio = future.result()
+            with metrics.stage("resample", model_id):
+                return resample(audio, native_rate, sample_rate)
+
+        # Split into sentences (and clauses of long ones). Chunks not in the segment cache are
+        # queued at once so the workers render them in parallel, then all are spliced in order
+        chunks = self.chunk(text)
+        submitted = {}
+        for chunk, _ in chunks:
+            if chunk not in submitted:
+                submitted[chunk] = self.submit_segment(speaker, chunk, model_id, sample_rate)
+        futures = [submitted[chunk] for chunk, _ in chunks]
+        with profiling.span("inference_wait"):
+            pieces = [f.result() for f in futures]
+        with metrics.stage("assemble", model_id):
+            audio = assemble(pieces, [pause for _, pause in chunks], native_rate)
+        with metrics.stage("resample", model_id):
+            return resample(audio, native_rate, sample_rate)
+
+    def cache_key(self, speaker, text, response_format="wav", model_id=None, sample_rate=None) -> str:
+        "Cache key / ETag for prepared text"
+        return self.cache.make_key(model_id or self.current_model, speaker, sample_rate or self.sample_rate, response_format,
+                                   self.sentence_pause_ms, self.clause_pause_ms, text)
+
+    def generate(self, speaker, text, session="", model_id=None, response_format="wav", sample_rate=None, protocol="http") -> AudioResult:
+        "Synthesize text and encode it in memory, reusing cached audio when possible"
+        started = time.perf_counter()
+        check_format(response_format)
+        model_id = model_id or self.current_model
+        sample_rate = encoder_rate(response_format, sample_rate or self.sample_rate)
+        text = self.prepare_text(text, model_id)
+        key = self.cache_key(speaker, text, response_format, model_id, sample_rate)
+        # A profiled request always runs the model, a cache hit would tell nothing
+        audio = None if profiling.active() else self.cache.get(key)
+        if audio is None:
+            pcm = self.synthesize(speaker, text, model_id, sample_rate)
+            with metrics.stage("encode", model_id):
+                audio = encode(pcm, sample_rate, response_format)
+            self.cache.put(key, audio)
+            metrics.observe_synthesis(protocol, model_id, speaker, len(text), len(pcm) / sample_rate, time.perf_counter() - started)
         else:
-            audio_path = Path(self.model.save_wav(text=text,speaker=speaker,sample_rate=self.sample_rate))
+            metrics.observe_cached(protocol, model_id, speaker, time.perf_counter() - started)
         if session:
-            self.save_session_audio(audio_path, session, speaker)
-        return audio_path
+            self.save_session_audio(audio, session, speaker, response_format, model_id, key)
+        return AudioResult(audio, key, MEDIA_TYPES[response_format])
+
+    def stream_sentences(self, speaker, text, model_id=None, sample_rate=None) -> Iterator[torch.Tensor]:
+        "Synthesize prepared text one sentence at a time, yielding audio at sample_rate as soon as each is ready"
+        model_id = model_id or self.current_model
+        sample_rate = sample_rate or self.sample_rate
+        native_rate = closest_rate(sample_rate)
+        chunks = self.chunk(text)
+        future = self.submit_segment(speaker, chunks[0][0], model_id, sample_rate) if chunks else None
+        for i, (_, pause) in enumerate(chunks):
+            audio = future.result()
+            with metrics.stage("resample", model_id):
+                audio = resample(audio, native_rate, sample_rate)
+            # Queue the next sentence only now, so it can't hold back the one being waited on.
+            # The stream was accepted with its first sentence, a full queue must not cut it short
+            if i + 1 < len(chunks):
+                future = self.submit_segment(speaker, chunks[i + 1][0], model_id, sample_rate, admitted=True)
+            if pause:
+                audio = torch.cat([silence(pause, sample_rate), audio])
+            yield audio
+
+    def generate_stream(self, speaker, text, session="", model_id=None, response_format="wav", sample_rate=None, protocol="http") -> Iterator[bytes]:
+        "Stream encoded audio, sending what the encoder has produced after every sentence"
+        started = time.perf_counter()
+        check_format(response_format)
+        model_id = model_id or self.current_model
+        sample_rate = encoder_rate(response_format, sample_rate or self.sample_rate)
+        text = self.prepare_text(text, model_id)
+        key = self.cache_key(speaker, text, response_format, model_id, sample_rate)
+        cached = self.cache.get(key)
+        if cached is not None:
+            metrics.observe_cached(protocol, model_id, speaker, time.perf_counter() - started)
+            if session:
+                self.save_session_audio(cached, session, speaker, response_format, model_id, key)
+            yield cached
+            return
+
+        encoder = StreamEncoder(response_format, sample_rate)
+        encoded = []
+        samples = 0
+        for audio in self.stream_sentences(speaker, text, model_id, sample_rate):
+            samples += len(audio)
+            with metrics.stage("encode", model_id):
+                encoded.append(encoder.write(audio))
+            if encoded[-1]:
+                yield encoded[-1]
+        with metrics.stage("encode", model_id):
+            encoded.append(encoder.close())
+        if encoded[-1]:
+            yield encoded[-1]
+        metrics.observe_synthesis(protocol, model_id, speaker, len(text), samples / sample_rate, time.perf_counter() - started)
+        if session:
+            self.save_session_audio(b"".join(encoded), session, speaker, response_format, model_id)
+
+    async def run_async(self, func, *args, **kwargs):
+        "Run blocking service work on the executor, keeping the caller's context (e.g. an active profile)"
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(context.run, func, *args, **kwargs))
+
+    async def iterate_async(self, iterator: Iterator) -> AsyncIterator:
+        "Drive a blocking iterator on the executor one item at a time"
+        done = object()
+        while (item := await self.run_async(next, iterator, done)) is not done:
+            yield item
+
+    async def agenerate(self, speaker, text, session="", model_id=None, response_format="wav", sample_rate=None, protocol="http") -> AudioResult:
+        return await self.run_async(self.generate, speaker, text, session, model_id, response_format, sample_rate, protocol)
+
+    def agenerate_stream(self, speaker, text, session="", model_id=None, response_format="wav", sample_rate=None, protocol="http") -> AsyncIterator[bytes]:
+        return self.iterate_async(self.generate_stream(speaker, text, session, model_id, response_format, sample_rate, protocol))
+
+    async def agenerate_batch(self, items, response_format="wav", sample_rate=None, concurrency=16, retries=5,
+                              protocol="batch") -> AsyncIterator[tuple[int, Optional[AudioResult], Optional[Exception]]]:
+        """
+        Generate (speaker, text, model_id) items, yielding (index, result, error) as each one finishes.
+        Up to concurrency items run at once and their sentences share the scheduler's batches.
+        An item turned away by a full queue waits and is retried, other errors only fail that item.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(index, speaker, text, model_id):
+            async with semaphore:
+                for attempt in range(retries):
+                    try:
+                        return index, await self.agenerate(speaker, text, model_id=model_id, response_format=response_format,
+                                                           sample_rate=sample_rate, protocol=protocol), None
+                    except ServiceBusy as e:
+                        if attempt + 1 == retries:
+                            return index, None, e
+                        await asyncio.sleep(e.retry_after)
+                    except Exception as e:
+                        logger.error(f"Batch item {index} failed: {e}")
+                        return index, None, e
+
+        tasks = [asyncio.ensure_future(run(index, *item)) for index, item in enumerate(items)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # The client went away, don't start the items still waiting
+            for task in tasks:
+                task.cancel()
+
+    async def aprepare_text(self, text, model_id=None) -> str:
+        return await self.run_async(self.prepare_text, text, model_id)
+
+    def astream_sentences(self, speaker, text, model_id=None, sample_rate=None) -> AsyncIterator[torch.Tensor]:
+        return self.iterate_async(self.stream_sentences(speaker, text, model_id, sample_rate))
+
+    async def aget_speakers(self, model_id=None) -> list[str]:
+        "Speakers of a model, which may have to be loaded first"
+        return await self.run_async(self.get_speakers, model_id)
 
     def split_text(self, text:str) -> list[str]:
-        # Split text into chunks less than self.max_char_length
-        chunk_list = []
-        chunk_str = ""
-
-        for word in text.split(' '):
-            word = word.replace('\n',' ') + " "
-            if len(chunk_str + word) > self.max_char_length:
-                chunk_list.append(chunk_str)
-                chunk_str = ""
-            chunk_str += word
-        
-        # Add the last chunk
-        if len(chunk_str) > 0:
-            chunk_list.append(chunk_str)
-
-        return chunk_list
-
-
-    def combine_audio(self, audio_segments):
-        combined_audio = AudioSegment.from_mono_audiosegments(audio_segments)
-        return combined_audio
-
-    def save_session_audio(self, audio_path:Path, session:Path, speaker):
-        if not self.sessions_path:
-            raise Exception(r"Session not initialized. Call /tts/init_session with {'path':'desired\session\path'}")
-        session_path = self.sessions_path.joinpath(session)
-        if not session_path.exists():
-            session_path.mkdir()
-        dst = session_path.joinpath(f"tts_{session}_{int(time.time())}_{speaker}_.wav")
-        shutil.copy(audio_path, dst)
-
-    def get_speakers(self):
+        "Split text into chunks no longer than self.max_char_length on sentence and clause boundaries"
+        return [chunk for chunk, _ in chunk_text(text, self.max_char_length)]
+
+    def save_session_audio(self, audio:bytes, session:Path, speaker, response_format="wav", model_id=None, key=None):
+        "Queue audio for the session writer, linking the cached copy when key is in the disk cache"
+        cache_file = self.cache.file_for(key) if key else None
+        self.session_writer.submit(SessionAudio(str(session), speaker, response_format, audio, model_id or self.current_model, cache_file))
+
+    def get_speakers(self, model_id=None):
         "List different speakers in model"
-        return self.model.speakers
-
-    def generate_samples(self):
-        "Remove current samples and generate new ones for all speakers."
-        logger.warning("Removing current samples")
-        for file in self.sample_path.iterdir():
-            os.remove(self.sample_path.joinpath(file))
-
-        logger.info("Creating new samples. This should take a minute...")
-        for speaker in self.model.speakers: 
-            sample_name = Path(self.sample_path.joinpath(f"{speaker}.wav"))
-            if sample_name.exists():
-                continue
-            audio = Path(self.model.save_wav(text=self.sample_text,speaker=speaker,sample_rate=self.sample_rate))
-            audio.rename(self.sample_path.joinpath(sample_name))
-        logger.info("New samples created")
+        self.require_ready()
+        return self.registry.get(model_id or self.current_model).speakers
+
+    def generate_samples(self, model_id=None):
+        "Render samples for all speakers of a model with the current sample text, in the background"
+        logger.info("Creating new samples in the background")
+        return self.samples.refresh(model_id)
 
     def update_sample_text(self,text: str):
         "Update the text used to generate samples"
@@ -154,32 +448,10 @@ class SileroTtsService:
         self.sample_text = text
         logger.info(f"Sample text updated to {self.sample_text}")  
 
-    def list_languages(self):
-        'Grab all v3 model links from https://models.silero.ai/models/tts'
-        lang_file = Path('langs.json')
-        if lang_file.exists():
-            with lang_file.open('r') as fh:
-                logger.info('Loading cached language index')
-                return json.load(fh)
-        logger.info('Loading remote language index')
-        lang_base_url = 'https://models.silero.ai/models/tts'
-        lang_urls = {}
-
-        # Parse initial web directory for languages
-        response = requests.get(lang_base_url)
-        langs = [lang.split('/')[0] for lang in response.text.split('<a href="')][1:]
-
-        # Enter each web directory and grab vX model file links
-        for lang in langs:
-            response = requests.get(f"{lang_base_url}/{lang}")
-            if not response.ok:
-                raise f"Failed to get languages: {response.status_code}"
-            lang_files = [f.split('"')[0] for f in response.text.split('<a href="')][1:]
-
-            # If a valid v3/v4/v5 file, add to list
-            for lang_file in lang_files:
-                if lang_file.startswith(('v3', 'v4', 'v5')):
-                    lang_urls[lang_file]=f"{lang_base_url}/{lang}/{lang_file}"
-        with open('langs.json','w') as fh:
-            json.dump(lang_urls,fh)
-        return lang_urls
\ No newline at end of file
+    def list_languages(self, block=True):
+        "Model file names and download URLs from the model index, refreshed in the background when stale"
+        return self.model_index.get(block, on_update=self.update_languages)
+
+    def update_languages(self, langs: dict):
+        self.langs = langs
+        logger.info(f"Model index updated, {len(langs)} models available")
@@ -0,0 +1,114 @@
+import multiprocessing
+from collections import OrderedDict
+import torch
+from loguru import logger
+from silero_api_server.model_store import load_package
+
+class ServiceBusy(Exception):
+    "Raised when the inference queue is full"
+    def __init__(self, retry_after: int = 1, message: str = "") -> None:
+        super().__init__(message or f"Inference queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+class ServiceNotReady(ServiceBusy):
+    "Raised while the model is still loading"
+    def __init__(self, retry_after: int = 5) -> None:
+        super().__init__(retry_after, "Model is still loading")
+
+def run_tts(model, speaker, sample_rate, texts: list[str]) -> list[torch.Tensor]:
+    with torch.no_grad():
+        return [model.apply_tts(text=text, speaker=speaker, sample_rate=sample_rate).cpu() for text in texts]
+
+class LocalWorker:
+    "Runs batches on the service's own model, the default single worker"
+    def __init__(self, service, threads: int) -> None:
+        self.service = service
+        self.threads = threads
+
+    def start(self):
+        # Intra-op thread count is per calling thread under OpenMP
+        torch.set_num_threads(self.threads)
+
+    def infer(self, model_id, speaker, sample_rate, texts):
+        return self.service.infer_batch(model_id, speaker, sample_rate, texts)
+
+    def close(self):
+        pass
+
+class ThreadWorker(LocalWorker):
+    "Worker thread with model replicas of its own, at most as many as the registry keeps resident"
+    def __init__(self, service, threads: int) -> None:
+        super().__init__(service, threads)
+        self.models = OrderedDict()
+
+    def infer(self, model_id, speaker, sample_rate, texts):
+        if model_id not in self.models:
+            while len(self.models) >= self.service.registry.max_models:
+                self.models.popitem(last=False)
+            self.models[model_id] = load_package(self.service.download_model(model_id), self.service.device)
+        self.models.move_to_end(model_id)
+        return run_tts(self.models[model_id], speaker, sample_rate, texts)
+
+    def close(self):
+        self.models.clear()
+
+def _process_main(conn, threads: int, device: str, max_models: int):
+    "Entry point of a worker process: load models on demand and answer batches over the pipe"
+    torch.set_num_threads(threads)
+    models = OrderedDict()
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        path, speaker, sample_rate, texts = job
+        try:
+            if path not in models:
+                while len(models) >= max_models:
+                    models.popitem(last=False)
+                models[path] = load_package(path, torch.device(device))
+            models.move_to_end(path)
+            conn.send(("ok", [audio.numpy() for audio in run_tts(models[path], speaker, sample_rate, texts)]))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+
+class ProcessWorker:
+    "Worker backed by a separate process holding its own model replica"
+    def __init__(self, service, threads: int) -> None:
+        self.service = service
+        self.threads = threads
+        self.process = None
+
+    def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_process_main, daemon=True,
+                                   args=(child_conn, self.threads, str(self.service.device),
+                                         self.service.registry.max_models))
+        self.process.start()
+
+    def infer(self, model_id, speaker, sample_rate, texts):
+        self.conn.send((str(self.service.download_model(model_id)), speaker, sample_rate, texts))
+        status, result = self.conn.recv()
+        if status != "ok":
+            raise Exception(result)
+        return [torch.from_numpy(audio) for audio in result]
+
+    def close(self):
+        if self.process and self.process.is_alive():
+            self.conn.send(None)
+            self.process.join(timeout=5)
+
+WORKER_MODES = {"thread": ThreadWorker, "process": ProcessWorker}
+
+def create_workers(service, count=1, mode="thread", threads=4) -> list:
+    "The first thread worker shares the service model, every other worker gets its own replica"
+    if mode not in WORKER_MODES:
+        raise Exception(f"Unknown worker mode {mode}, expected one of {list(WORKER_MODES)}")
+    workers = []
+    for i in range(count):
+        if mode == "thread" and i == 0:
+            workers.append(LocalWorker(service, threads))
+        else:
+            workers.append(WORKER_MODES[mode](service, threads))
+    logger.info(f"Created {count} {mode} inference worker(s) with {threads} threads each")
+    return workers
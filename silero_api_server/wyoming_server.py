@@ -1,87 +1,231 @@
 import asyncio
 import logging
+import time
 from pathlib import Path
 from typing import Optional
 
 from wyoming.audio import AudioStart, AudioChunk, AudioStop
-from wyoming.event import Event
+from wyoming.error import Error
+from wyoming.event import Event, async_write_event
 from wyoming.info import Describe, Info, TtsVoice, TtsProgram, Attribution
 from wyoming.server import AsyncTcpServer, AsyncEventHandler
-from wyoming.tts import Synthesize
+from wyoming.tts import Synthesize, SynthesizeStart, SynthesizeChunk, SynthesizeStop, SynthesizeStopped
 
-from silero_api_server.tts import SileroTtsService
-from pydub import AudioSegment
+from silero_api_server.tts import SileroTtsService, UnknownModel
+from silero_api_server import metrics
+from silero_api_server.audio import to_pcm16
+from silero_api_server.text_utils import SENTENCE_END
 
 _LOGGER = logging.getLogger(__name__)
 
+DEFAULT_VOICE = "baya"
+
+# PCM 16-bit 22050Hz Mono (standard for Wyoming)
+DEFAULT_RATE = 22050
+CHUNK_SIZE = 2048
+
+# Silero model directories holding packages for several languages, not a language themselves
+MULTI_LANGUAGE_DIRS = ("cyrillic", "indic", "multi")
+# Silero directory names that differ from the language code Home Assistant matches on
+LANGUAGE_CODES = {"ua": "uk"}
+
+def language_code(directory: str) -> Optional[str]:
+    "Language code for a Silero model directory, None for multi-language packages"
+    if directory in MULTI_LANGUAGE_DIRS:
+        return None
+    return LANGUAGE_CODES.get(directory, directory)
+
+class _EventBuffer:
+    "Stands in for a StreamWriter to capture the bytes of a serialized event"
+    def __init__(self) -> None:
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+    def writelines(self, lines):
+        for line in lines:
+            self.data += line
+
+    async def drain(self):
+        pass
+
+class InfoCache:
+    """
+    The serialized Info event, built once per set of resident models and default
+    model. Also maps each voice to the models that have it, default model first.
+    """
+    def __init__(self, tts_service: SileroTtsService) -> None:
+        self.tts_service = tts_service
+        self.key = None
+        self.data = b""
+        self.voice_models: dict[str, list[str]] = {}
+
+    async def get(self) -> bytes:
+        service = self.tts_service
+        key = (service.registry.version, service.current_model)
+        if key != self.key:
+            await self._build(key)
+        return self.data
+
+    async def _build(self, key):
+        service = self.tts_service
+        models = [service.current_model] + [m for m in service.registry.resident() if m != service.current_model]
+        voice_models: dict[str, list[str]] = {}
+        for model_id in models:
+            for speaker in await service.aget_speakers(model_id):
+                voice_models.setdefault(speaker, []).append(model_id)
+
+        attribution = Attribution(name="Silero", url="https://github.com/snakers4/silero-models")
+        voices = [TtsVoice(
+            name=speaker,
+            description=f"Silero speaker {speaker}",
+            attribution=attribution,
+            installed=True,
+            version="1.0",
+            languages=list(dict.fromkeys(code for m in model_ids if (code := language_code(service.model_language(m)))))
+        ) for speaker, model_ids in voice_models.items()]
+        info = Info(tts=[TtsProgram(
+            name="Silero",
+            attribution=attribution,
+            installed=True,
+            description="Silero TTS API Server",
+            version="1.0",
+            voices=voices,
+            supports_synthesize_streaming=True
+        )])
+        buffer = _EventBuffer()
+        await async_write_event(info.event(), buffer)
+        self.data, self.voice_models, self.key = bytes(buffer.data), voice_models, key
+        _LOGGER.info(f"Wyoming info rebuilt with {len(voices)} voices from {models}")
+
 class SileroWyomingHandler(AsyncEventHandler):
-    def __init__(self, tts_service: SileroTtsService, *args, **kwargs):
+    def __init__(self, tts_service: SileroTtsService, *args, sample_rate: int = DEFAULT_RATE, info_cache: Optional[InfoCache] = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.tts_service = tts_service
+        self.sample_rate = sample_rate
+        self.info_cache = info_cache or InfoCache(tts_service)
+        self.streaming = False
+        self.stream_voice = DEFAULT_VOICE
+        self.stream_model = None
+        self.stream_text = ""
+        self.audio_open = False # AudioStart sent without its AudioStop yet
 
     async def handle_event(self, event: Event) -> bool:
+        try:
+            return await self._handle(event)
+        except Exception as e:
+            # Close what the client is waiting for and keep the connection for its next request
+            _LOGGER.exception(f"Synthesis failed: {e}")
+            if self.audio_open:
+                await self.stop_audio()
+            await self.write_event(Error(text=str(e), code=type(e).__name__).event())
+            if self.streaming:
+                self.streaming = False
+                self.stream_text = ""
+                await self.write_event(SynthesizeStopped().event())
+            return True
+
+    async def start_audio(self):
+        await self.write_event(AudioStart(rate=self.sample_rate, width=2, channels=1).event())
+        self.audio_open = True
+
+    async def stop_audio(self):
+        self.audio_open = False
+        await self.write_event(AudioStop().event())
+
+    async def _handle(self, event: Event) -> bool:
         if Describe.is_type(event.type):
-            voices = []
-            attribution = Attribution(name="Silero", url="https://github.com/snakers4/silero-models")
-            for speaker in self.tts_service.get_speakers():
-                voices.append(TtsVoice(
-                    name=speaker,
-                    description=f"Silero speaker {speaker}",
-                    attribution=attribution,
-                    installed=True,
-                    version="1.0",
-                    languages=["ru"]
-                ))
-            
-            info = Info(tts=[TtsProgram(
-                name="Silero",
-                attribution=attribution,
-                installed=True,
-                description="Silero TTS API Server",
-                version="1.0",
-                voices=voices
-            )])
-            await self.write_event(info.event())
+            self.writer.write(await self.info_cache.get())
+            await self.writer.drain()
             return True
 
         if Synthesize.is_type(event.type):
+            if self.streaming:
+                # Sent alongside streaming events for older clients, text arrives via chunks
+                return True
             synthesize = Synthesize.from_event(event)
-            _LOGGER.info(f"Synthesizing: {synthesize.text} with voice {synthesize.voice.name}")
-            
-            voice = synthesize.voice.name if synthesize.voice else "baya"
-            # Generate audio using the service
-            audio_path = self.tts_service.generate(voice, synthesize.text)
-            
-            # Load and convert to PCM 16-bit 22050Hz Mono (standard for Wyoming)
-            audio = AudioSegment.from_file(audio_path)
-            audio = audio.set_frame_rate(22050).set_channels(1).set_sample_width(2)
-            raw_data = audio.raw_data
-            
-            # Send AudioStart
-            await self.write_event(AudioStart(rate=22050, width=2, channels=1).event())
-            
-            # Send AudioChunks
-            chunk_size = 2048
-            for i in range(0, len(raw_data), chunk_size):
-                chunk_data = raw_data[i:i+chunk_size]
-                await self.write_event(AudioChunk(rate=22050, width=2, channels=1, audio=chunk_data).event())
-                
-            # Send AudioStop
-            await self.write_event(AudioStop().event())
-            return False # Close connection after synthesis
+            voice, model_id = await self.resolve_voice(synthesize.voice)
+            _LOGGER.info(f"Synthesizing: {synthesize.text} with voice {voice} ({model_id})")
+
+            await self.start_audio()
+            await self.speak(voice, synthesize.text, model_id)
+            await self.stop_audio()
+            return True # Keep the connection for the client's next request
+
+        if SynthesizeStart.is_type(event.type):
+            start = SynthesizeStart.from_event(event)
+            self.streaming = True
+            self.stream_voice, self.stream_model = await self.resolve_voice(start.voice)
+            self.stream_text = ""
+            await self.start_audio()
+            return True
+
+        if SynthesizeChunk.is_type(event.type) and self.streaming:
+            self.stream_text += SynthesizeChunk.from_event(event).text
+            # Speak every finished sentence, keep the trailing partial one for later chunks
+            *sentences, self.stream_text = SENTENCE_END.split(self.stream_text)
+            for sentence in sentences:
+                await self.speak(self.stream_voice, sentence, self.stream_model)
+            return True
+
+        if SynthesizeStop.is_type(event.type) and self.streaming:
+            await self.speak(self.stream_voice, self.stream_text, self.stream_model)
+            self.streaming = False
+            self.stream_text = ""
+            await self.stop_audio()
+            await self.write_event(SynthesizeStopped().event())
+            return True
 
         return True
 
+    async def resolve_voice(self, voice) -> tuple[str, str]:
+        "Voice name and model for a request: the voice's language if given, else a resident model having that voice"
+        name = voice.name if voice and voice.name else DEFAULT_VOICE
+        if voice and voice.language:
+            try:
+                return name, self.tts_service.resolve_model(language=voice.language)
+            except UnknownModel as e:
+                _LOGGER.warning(f"{e}, picking a model by voice")
+        await self.info_cache.get()
+        models = self.info_cache.voice_models.get(name)
+        return name, models[0] if models else self.tts_service.current_model
+
+    async def speak(self, voice: str, text: str, model_id: Optional[str] = None):
+        "Synthesize text sentence by sentence, sending each one as soon as it is ready"
+        if not text.strip():
+            return
+        service = self.tts_service
+        model_id = model_id or service.current_model
+        started = time.perf_counter()
+        text = await service.aprepare_text(text, model_id)
+        samples = 0
+        async for audio in service.astream_sentences(voice, text, model_id, self.sample_rate):
+            samples += len(audio)
+            raw_data = to_pcm16(audio)
+            for i in range(0, len(raw_data), CHUNK_SIZE):
+                chunk_data = raw_data[i:i+CHUNK_SIZE]
+                await self.write_event(AudioChunk(rate=self.sample_rate, width=2, channels=1, audio=chunk_data).event())
+        metrics.observe_synthesis("wyoming", model_id, voice, len(text), samples / self.sample_rate, time.perf_counter() - started)
+
 class SileroWyomingServer(AsyncTcpServer):
-    def __init__(self, host: str, port: int, tts_service: SileroTtsService):
+    def __init__(self, host: str, port: int, tts_service: SileroTtsService, sample_rate: int = DEFAULT_RATE):
         super().__init__(host, port)
         self.tts_service = tts_service
+        self.sample_rate = sample_rate
+        self.info_cache = InfoCache(tts_service)
 
     def create_handler(self, reader, writer):
-        return SileroWyomingHandler(self.tts_service, reader, writer)
+        return SileroWyomingHandler(self.tts_service, reader, writer, sample_rate=self.sample_rate, info_cache=self.info_cache)
 
-async def run_wyoming_server(host: str, port: int, tts_service: SileroTtsService):
-    server = SileroWyomingServer(host, port, tts_service)
+async def run_wyoming_server(host: str, port: int, tts_service: SileroTtsService, sample_rate: int = DEFAULT_RATE):
+    # Don't accept connections before the model is loaded. Polled, so the wait can be
+    # cancelled and a failed startup stops the server instead of waiting forever
+    while not tts_service.ready.is_set():
+        if tts_service.startup_error:
+            raise Exception(f"Wyoming server not started, model failed to load: {tts_service.startup_error}") from tts_service.startup_error
+        await asyncio.sleep(0.2)
+    server = SileroWyomingServer(host, port, tts_service, sample_rate)
     _LOGGER.info(f"Wyoming server started on {host}:{port}")
     await server.run(server.create_handler)
 
@@ -95,13 +239,15 @@ if __name__ == "__main__":
     parser.add_argument("--uri", help="tcp://host:port")
     parser.add_argument("--language", default="v5_ru.pt")
     parser.add_argument("--samples", default="samples")
+    parser.add_argument("--sample-rate", type=int, default=DEFAULT_RATE)
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.INFO)
     
     # Initialize service
     module_path = Path(__file__).resolve().parent
-    tts_service = SileroTtsService(args.samples, lang=args.language)
+    tts_service = SileroTtsService(args.samples)
+    tts_service.start(args.language)
     
     if args.uri:
         # Example tcp://0.0.0.0:10200
@@ -109,4 +255,4 @@ if __name__ == "__main__":
         args.host = host
         args.port = int(port)
 
-    asyncio.run(run_wyoming_server(args.host, args.port, tts_service))
+    asyncio.run(run_wyoming_server(args.host, args.port, tts_service, args.sample_rate))
@@ -0,0 +1,57 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+class StubServer:
+    """
+    Local HTTP server answering from handlers registered per path. A handler gets
+    the method and request headers and returns (status, headers, body).
+    """
+    def __init__(self) -> None:
+        self.routes = {}
+        self.requests = [] # (method, path, headers) of every request, in arrival order
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._answer("GET")
+
+            def do_HEAD(self):
+                self._answer("HEAD")
+
+            def _answer(self, method):
+                headers = dict(self.headers)
+                with stub._lock:
+                    stub.requests.append((method, self.path, headers))
+                route = stub.routes.get(self.path)
+                status, response_headers, body = route(method, headers) if route else (404, {}, b"")
+                self.send_response(status)
+                for name, value in response_headers.items():
+                    self.send_header(name, value)
+                if "Content-Length" not in response_headers:
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if method != "HEAD":
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def count(self, method=None, path=None) -> int:
+        return sum(1 for m, p, _ in self.requests if (method is None or m == method) and (path is None or p == path))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.close()
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+import pytest
+from silero_api_server.model_index import ModelIndex
+
+def listing(*links) -> bytes:
+    return "".join(f'<a href="{link}">{link}</a>\n' for link in links).encode()
+
+def page(body: bytes, etag: str):
+    "Route answering 304 when the client already has etag"
+    def route(method, headers):
+        if headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"ETag": etag, "Content-Type": "text/html"}, body
+    return route
+
+@pytest.fixture
+def listings(stub_server):
+    stub_server.routes["/tts"] = page(listing("../", "ru/", "en/", "?C=M"), '"root"')
+    stub_server.routes["/tts/ru"] = page(listing("../", "v4_ru.pt", "v5_ru.pt", "notes.txt"), '"ru"')
+    stub_server.routes["/tts/en"] = page(listing("../", "v3_en.pt"), '"en"')
+    return stub_server
+
+def test_refresh_crawls_every_language(tmp_path, listings):
+    index = ModelIndex(tmp_path / "langs.json", f"{listings.url}/tts")
+    models = index.refresh()
+    assert models == {
+        "v4_ru.pt": f"{listings.url}/tts/ru/v4_ru.pt",
+        "v5_ru.pt": f"{listings.url}/tts/ru/v5_ru.pt",
+        "v3_en.pt": f"{listings.url}/tts/en/v3_en.pt",
+    }
+    assert index.load()["models"] == models
+
+def test_refresh_revalidates_stored_pages(tmp_path, listings):
+    index = ModelIndex(tmp_path / "langs.json", f"{listings.url}/tts")
+    models = index.refresh()
+    pages = index.load()["pages"]
+    listings.requests.clear()
+
+    assert index.refresh() == models
+    # Every page was asked for with its stored ETag and answered 304 from the stored links
+    assert len(listings.requests) == 3
+    assert all(headers.get("If-None-Match") for _, _, headers in listings.requests)
+    assert index.load()["pages"] == pages
+
+def test_failed_page_raises(tmp_path, listings):
+    listings.routes["/tts/en"] = lambda method, headers: (500, {}, b"")
+    index = ModelIndex(tmp_path / "langs.json", f"{listings.url}/tts")
+    with pytest.raises(Exception, match="500"):
+        index.refresh()
+    assert not (tmp_path / "langs.json").exists()
+
+def test_offline_makes_no_request(tmp_path, listings):
+    path = tmp_path / "langs.json"
+    assert ModelIndex(path, f"{listings.url}/tts", offline=True).get() == {}
+    # Even an expired index is served as is
+    path.write_text(json.dumps({"fetched": 0, "models": {"v5_ru.pt": "old"}, "pages": {}}))
+    assert ModelIndex(path, f"{listings.url}/tts", offline=True).get() == {"v5_ru.pt": "old"}
+    assert listings.requests == []
+
+def test_stale_index_is_served_while_refreshing(tmp_path, listings):
+    path = tmp_path / "langs.json"
+    path.write_text(json.dumps({"fetched": time.time() - 7200, "models": {"v5_ru.pt": "old"}, "pages": {}}))
+    index = ModelIndex(path, f"{listings.url}/tts", ttl=3600)
+    updated = threading.Event()
+    received = {}
+
+    def on_update(models):
+        received.update(models)
+        updated.set()
+
+    assert index.get(on_update=on_update) == {"v5_ru.pt": "old"}
+    assert updated.wait(10)
+    assert received["v5_ru.pt"] == f"{listings.url}/tts/ru/v5_ru.pt"
+    assert not index.expired(index.load())
+
+def test_legacy_flat_index_is_read(tmp_path):
+    path = tmp_path / "langs.json"
+    path.write_text(json.dumps({"v5_ru.pt": "https://example/ru/v5_ru.pt"}))
+    data = ModelIndex(path, offline=True).load()
+    assert data["models"] == {"v5_ru.pt": "https://example/ru/v5_ru.pt"}
+    assert ModelIndex(path).expired(data)
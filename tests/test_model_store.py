@@ -0,0 +1,112 @@
+import io
+import json
+import random
+import threading
+import zipfile
+import pytest
+from silero_api_server import model_store
+from silero_api_server.model_store import fetch_model, verify_model
+
+BLOCK = 1024
+
+def make_model(seed=0) -> bytes:
+    "A small stand-in package: a zip whose member CRCs verify_model can check"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr("model/data.pkl", random.Random(seed).randbytes(10 * BLOCK))
+    return buffer.getvalue()
+
+class ModelFile:
+    "Route serving a model file, with range support unless ranges is off"
+    def __init__(self, data: bytes, etag='"v1"', ranges=True) -> None:
+        self.data = data
+        self.etag = etag
+        self.ranges = ranges
+        self.fail = set() # Block starts answered with an error, once each
+
+    def __call__(self, method, headers):
+        if method == "HEAD":
+            response_headers = {"Content-Length": str(len(self.data)), "ETag": self.etag}
+            if self.ranges:
+                response_headers["Accept-Ranges"] = "bytes"
+            return 200, response_headers, b""
+        if self.ranges and "Range" in headers and headers.get("If-Range", self.etag) == self.etag:
+            start, end = (int(pos) for pos in headers["Range"].removeprefix("bytes=").split("-"))
+            if start in self.fail:
+                self.fail.discard(start)
+                return 500, {}, b""
+            return 206, {"Content-Range": f"bytes {start}-{end}/{len(self.data)}", "ETag": self.etag}, self.data[start:end + 1]
+        return 200, {"ETag": self.etag}, self.data
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    monkeypatch.setattr(model_store, "DOWNLOAD_BLOCK", BLOCK)
+
+def ranged_gets(server) -> int:
+    return sum(1 for method, _, headers in server.requests if method == "GET" and "Range" in headers)
+
+def test_download_resumes_after_failed_block(tmp_path, stub_server):
+    model = stub_server.routes["/v5_ru.pt"] = ModelFile(make_model())
+    model.fail.add(3 * BLOCK)
+    dest = tmp_path / "v5_ru.pt"
+    with pytest.raises(Exception, match="Range request"):
+        fetch_model(dest, f"{stub_server.url}/v5_ru.pt")
+    assert not dest.exists()
+    done = json.loads((tmp_path / "v5_ru.pt.part.json").read_text())["done"]
+    assert done and 3 * BLOCK not in done
+
+    stub_server.requests.clear()
+    assert fetch_model(dest, f"{stub_server.url}/v5_ru.pt").read_bytes() == model.data
+    # Only the blocks missing from the first attempt were fetched
+    assert ranged_gets(stub_server) == len(range(0, len(model.data), BLOCK)) - len(done)
+    assert not (tmp_path / "v5_ru.pt.part").exists()
+    assert not (tmp_path / "v5_ru.pt.part.json").exists()
+
+def test_changed_etag_discards_partial_download(tmp_path, stub_server):
+    model = stub_server.routes["/v5_ru.pt"] = ModelFile(make_model())
+    model.fail.add(3 * BLOCK)
+    dest = tmp_path / "v5_ru.pt"
+    with pytest.raises(Exception):
+        fetch_model(dest, f"{stub_server.url}/v5_ru.pt")
+
+    model.data, model.etag = make_model(seed=1), '"v2"'
+    stub_server.requests.clear()
+    assert fetch_model(dest, f"{stub_server.url}/v5_ru.pt").read_bytes() == model.data
+    assert ranged_gets(stub_server) == len(range(0, len(model.data), BLOCK))
+
+def test_server_without_ranges_gets_one_request(tmp_path, stub_server):
+    model = stub_server.routes["/v5_ru.pt"] = ModelFile(make_model(), ranges=False)
+    dest = fetch_model(tmp_path / "v5_ru.pt", f"{stub_server.url}/v5_ru.pt")
+    assert dest.read_bytes() == model.data
+    assert stub_server.count("GET") == 1
+    assert ranged_gets(stub_server) == 0
+
+def test_corrupt_download_is_rejected(tmp_path, stub_server):
+    data = bytearray(make_model())
+    data[len(data) // 2] ^= 0xFF # Inside the member, so its CRC no longer matches
+    stub_server.routes["/v5_ru.pt"] = ModelFile(bytes(data))
+    dest = tmp_path / "v5_ru.pt"
+    with pytest.raises(Exception, match="failed verification"):
+        fetch_model(dest, f"{stub_server.url}/v5_ru.pt")
+    assert not dest.exists()
+
+def test_verify_model_checks_sha256(tmp_path):
+    dest = tmp_path / "v5_ru.pt"
+    dest.write_bytes(make_model())
+    assert not verify_model(dest, "0" * 64)
+    assert verify_model(dest)
+    assert verify_model(dest, model_store._sha256(dest))
+
+def test_concurrent_callers_share_one_download(tmp_path, stub_server):
+    model = stub_server.routes["/v5_ru.pt"] = ModelFile(make_model())
+    dest = tmp_path / "v5_ru.pt"
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fetch_model(dest, f"{stub_server.url}/v5_ru.pt"))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [dest, dest]
+    assert dest.read_bytes() == model.data
+    assert stub_server.count("HEAD") == 1
+    assert ranged_gets(stub_server) == len(range(0, len(model.data), BLOCK))